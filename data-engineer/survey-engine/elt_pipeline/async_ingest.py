@@ -0,0 +1,150 @@
+import asyncio
+import json
+import os
+import time
+from pathlib import Path
+from typing import Iterable, Optional, Protocol
+from urllib.parse import quote
+
+import asyncpg
+
+from ingest import (COPY_STAGING_COLUMNS, COPY_STAGING_TABLE, MERGE_STAGING_SQL, DeadLetterFile,
+                    DeadLetterSink, PipelineStats, RespondentPartitioner, SurveyIngestor,
+                    SurveyResponse, batch_iterator, staging_table_ddl)
+
+class AsyncDataSink(Protocol):
+    async def save_batch(self, records: Iterable[SurveyResponse]) -> None:
+        """Saves a batch of cleaned records to the destination without blocking the event loop."""
+        ...
+
+class AsyncPostgresSink:
+    """
+    asyncpg counterpart of PooledPostgresSink + PostgresCopySink: binary COPY into
+    a session-local staging table, then one set-based merge, over a connection pool.
+    Open it with `async with AsyncPostgresSink(dsn) as sink:`.
+    """
+    def __init__(self, dsn: str, min_size: int = 1, max_size: int = 8):
+        self.dsn = dsn
+        self.min_size = min_size
+        self.max_size = max_size
+        self.pool = None
+
+    async def __aenter__(self):
+        self.pool = await asyncpg.create_pool(self.dsn, min_size=self.min_size, max_size=self.max_size)
+        return self
+
+    async def __aexit__(self, *exc):
+        await self.pool.close()
+
+    async def save_batch(self, records: Iterable[SurveyResponse]) -> None:
+        rows = [
+            (seq, r.respondent.id, r.respondent.age, r.respondent.location, json.dumps(r.answers), r.version)
+            for seq, r in enumerate(records)
+        ]
+        async with self.pool.acquire() as conn:
+            async with conn.transaction():
+                await conn.execute(staging_table_ddl("TEMP"))
+                await conn.copy_records_to_table(COPY_STAGING_TABLE, records=rows, columns=COPY_STAGING_COLUMNS)
+                await conn.execute(MERGE_STAGING_SQL)
+
+class FakeAsyncSink:
+    """Database-free sink for benchmarks: sleeps latency_s per batch and keeps the first row per respondent."""
+    def __init__(self, latency_s: float = 0.005):
+        self.latency_s = latency_s
+        self.rows: dict[str, SurveyResponse] = {}
+
+    async def save_batch(self, records: Iterable[SurveyResponse]) -> None:
+        await asyncio.sleep(self.latency_s)
+        for r in records:
+            self.rows.setdefault(r.respondent.id, r)
+
+async def run_async_pipeline(ingestor: SurveyIngestor, sink: AsyncDataSink, batch_size: int = 100,
+                             lanes: int = 8, queue_size: int = 2,
+                             dead_letters: Optional[DeadLetterSink] = None) -> PipelineStats:
+    """
+    Async driver loop: a worker thread reads and parses the next batch while up
+    to `lanes` batches are in flight against the sink. Records are partitioned
+    across lanes by respondent_id and each lane writes its batches in order, so
+    the result matches the sequential pipeline. Dead letters from a tolerant
+    ingestor are written from the reader thread.
+    """
+    stats = PipelineStats()
+    errors: list[BaseException] = []
+    queues = [asyncio.Queue(maxsize=queue_size) for _ in range(lanes)]
+
+    async def lane(q: asyncio.Queue) -> None:
+        while (batch := await q.get()) is not None:
+            if errors:
+                continue
+            t0 = time.perf_counter()
+            try:
+                await sink.save_batch(batch)
+            except Exception as exc:
+                errors.append(exc)
+                continue
+            stats.add(write_s=time.perf_counter() - t0)
+
+    raw_batches = batch_iterator(ingestor.stream_raw_records_with_offsets(), batch_size)
+
+    def read_and_parse():
+        t0 = time.perf_counter()
+        raw = next(raw_batches, None)
+        read_s = time.perf_counter() - t0
+        if raw is None:
+            return read_s, None
+        parsed = ingestor.parse_batch(raw)
+        if parsed.dead_letters and dead_letters is not None:
+            dead_letters.write(parsed.dead_letters)
+        return read_s, parsed
+
+    async def put(batches) -> None:
+        t0 = time.perf_counter()
+        for batch in batches:
+            await queues[batch.lane].put(batch.records)  # backpressure: waits while that lane is behind
+        stats.add(queue_wait_s=time.perf_counter() - t0)
+
+    partitioner = RespondentPartitioner(lanes, batch_size)
+    workers = [asyncio.create_task(lane(q)) for q in queues]
+    t_start = time.perf_counter()
+    try:
+        while not errors:
+            read_s, parsed = await asyncio.to_thread(read_and_parse)
+            stats.add(read_s=read_s)
+            if parsed is None:
+                break
+            stats.add_parsed(parsed)
+            await put(partitioner.add(parsed.records))
+        if not errors:
+            await put(partitioner.flush())
+    finally:
+        for q in queues:
+            await q.put(None)
+        await asyncio.gather(*workers)
+        stats.add(wall_s=time.perf_counter() - t_start)
+
+    if errors:
+        raise errors[0]
+    return stats
+
+def async_dsn_from_env() -> str:
+    user = quote(os.getenv("DB_USER", ""), safe="")
+    password = quote(os.getenv("DB_PASSWORD", ""), safe="")
+    return f"postgresql://{user}:{password}@{os.getenv('DB_HOST')}/{os.getenv('DB_NAME')}"
+
+async def main():
+    DATA_FILE = Path("/raw_data/raw_surveys.json")
+    ingestor = SurveyIngestor(DATA_FILE, fmt=os.getenv("INGEST_FORMAT", "auto"),
+                              tolerant=os.getenv("INGEST_TOLERANT", "0") == "1")
+    dead_letters = DeadLetterFile(Path(os.getenv("INGEST_DEAD_LETTER", "/raw_data/dead_letters.jsonl")),
+                                  source=str(DATA_FILE))
+    lanes = int(os.getenv("INGEST_ASYNC_LANES", 8))
+
+    async with AsyncPostgresSink(async_dsn_from_env(), max_size=lanes) as sink:
+        stats = await run_async_pipeline(
+            ingestor, sink, batch_size=int(os.getenv("INGEST_BATCH_SIZE", 100)), lanes=lanes,
+            dead_letters=dead_letters,
+        )
+    print(stats.report(parse_workers=0, sink_writers=lanes))
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,98 @@
+"""
+Benchmark the asyncio driver against the sequential loop, without a database:
+both write to fake sinks that sleep a fixed latency per batch (the round trip
+to Postgres), so the gain from keeping several batches in flight is visible.
+
+Usage:
+    python bench_async.py
+    python bench_async.py --records 200000 --latency_ms 10 --lanes 1 4 16 64
+    python bench_async.py --sink postgres     # real AsyncPostgresSink, DB_* env vars
+"""
+
+import argparse
+import asyncio
+import shutil
+import tempfile
+import time
+from pathlib import Path
+
+from async_ingest import AsyncPostgresSink, FakeAsyncSink, async_dsn_from_env, run_async_pipeline
+from bench_common import write_synthetic_file
+from ingest import SurveyIngestor, batch_iterator
+
+## Config -----------------------------
+RECORDS    = 50_000
+BATCH_SIZE = 500
+LATENCY_MS = 5.0
+LANES      = [1, 4, 16]
+
+
+## Helpers -----------------------------
+class FakeSink:
+    """Synchronous twin of FakeAsyncSink."""
+    def __init__(self, latency_s: float):
+        self.latency_s = latency_s
+        self.rows = {}
+
+    def save_batch(self, records):
+        time.sleep(self.latency_s)
+        for r in records:
+            self.rows.setdefault(r.respondent.id, r)
+
+
+def run_sequential(path: Path, batch_size: int, latency_s: float) -> tuple[float, dict]:
+    ingestor = SurveyIngestor(path)
+    sink = FakeSink(latency_s)
+    t0 = time.perf_counter()
+    responses = (ingestor.parse_record(raw) for raw in ingestor.stream_raw_records())
+    for batch in batch_iterator(responses, batch_size):
+        sink.save_batch(batch)
+    return time.perf_counter() - t0, sink.rows
+
+
+async def run_async(path: Path, batch_size: int, latency_s: float, lanes: int, sink_kind: str):
+    ingestor = SurveyIngestor(path)
+    if sink_kind == "fake":
+        sink = FakeAsyncSink(latency_s)
+        stats = await run_async_pipeline(ingestor, sink, batch_size, lanes)
+        return stats, sink.rows
+    async with AsyncPostgresSink(async_dsn_from_env(), max_size=lanes) as sink:
+        return await run_async_pipeline(ingestor, sink, batch_size, lanes), None
+
+
+## Main -----------------------------
+def main(records: int, batch_size: int, latency_ms: float, lanes: list[int], sink_kind: str, workdir: Path | None):
+    # A fresh directory per run unless one is given, so concurrent runs never share (or delete) files
+    own_dir = workdir is None
+    workdir = Path(tempfile.mkdtemp(prefix="survey-bench-")) if own_dir else workdir
+    path = workdir / f"surveys_{records}.json"
+    latency_s = latency_ms / 1e3
+    try:
+        write_synthetic_file(path, records)
+        print(f"{'driver':>16} {'seconds':>8} {'rec/s':>11}")
+        elapsed, expected = run_sequential(path, batch_size, latency_s)
+        print(f"{'sequential':>16} {elapsed:>8.2f} {records / elapsed:>11,.0f}", flush=True)
+
+        for n in lanes:
+            stats, rows = asyncio.run(run_async(path, batch_size, latency_s, n, sink_kind))
+            if rows is not None:
+                assert rows == expected, "async pipeline diverged from the sequential result"
+            print(f"{f'async lanes={n}':>16} {stats.wall_s:>8.2f} {records / stats.wall_s:>11,.0f}", flush=True)
+    finally:
+        if own_dir:
+            shutil.rmtree(workdir, ignore_errors=True)
+        else:
+            path.unlink(missing_ok=True)   # only this run's file: the directory may hold anything else
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="asyncio driver vs sequential loop")
+    parser.add_argument("--records",    default=RECORDS,    type=int,   help="Synthetic records")
+    parser.add_argument("--batch_size", default=BATCH_SIZE, type=int,   help="Records per batch")
+    parser.add_argument("--latency_ms", default=LATENCY_MS, type=float, help="Fake sink latency per batch")
+    parser.add_argument("--lanes",      default=LANES,      type=int, nargs="+", help="Batches in flight")
+    parser.add_argument("--sink",       default="fake", choices=["fake", "postgres"], help="Sink to drive")
+    parser.add_argument("--workdir",    default=None,       type=Path, help="Where to write the synthetic file (default: a fresh temp dir)")
+    args = parser.parse_args()
+
+    main(args.records, args.batch_size, args.latency_ms, args.lanes, args.sink, args.workdir)
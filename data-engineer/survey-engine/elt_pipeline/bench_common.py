@@ -0,0 +1,50 @@
+"""
+Shared helpers for the survey-engine benchmarks: synthetic survey dumps and
+peak-RSS measurement.
+"""
+
+import json
+import random
+import resource
+import sys
+from pathlib import Path
+from typing import Iterator
+
+LOCATIONS = ["New York", "London", "Rome", "Zürich", "Tokyo", None]
+ANSWERS   = ["Agree", "Disagree", "Neutral", "Strongly agree", "Strongly disagree"]
+
+
+def synthetic_records(n: int, seed: int = 0, id_prefix: str = "R_") -> Iterator[dict]:
+    """Yield n raw records, alternating between the v1 and v2 shapes."""
+    rng = random.Random(seed)
+    for i in range(n):
+        answers = {f"q{q}": rng.choice(ANSWERS) if q % 2 else rng.randint(1, 5) for q in range(1, 11)}
+        if i % 2 == 0:
+            yield {"id": f"{id_prefix}{i:09d}",
+                   "metadata": {"age": rng.randint(18, 90), "loc": rng.choice(LOCATIONS)},
+                   "responses": answers}
+        else:
+            yield {"respondent_id": f"{id_prefix}{i:09d}", "age": rng.randint(18, 90),
+                   "location": rng.choice(LOCATIONS), "answers": answers,
+                   "ts": f"2023-10-{rng.randint(1, 28):02d}T10:00:00"}
+
+
+def write_synthetic_file(path: Path, n: int, fmt: str = "array") -> Path:
+    """Write n synthetic records as a top-level JSON array or as NDJSON, streaming to disk."""
+    path.parent.mkdir(parents=True, exist_ok=True)
+    with open(path, "w", encoding="utf-8") as f:
+        if fmt == "array":
+            f.write("[\n")
+            for i, record in enumerate(synthetic_records(n)):
+                f.write((",\n  " if i else "  ") + json.dumps(record, ensure_ascii=False))
+            f.write("\n]\n")
+        else:
+            for record in synthetic_records(n):
+                f.write(json.dumps(record, ensure_ascii=False) + "\n")
+    return path
+
+
+def peak_rss_mb() -> float:
+    """Peak resident set size of this process in MB (ru_maxrss is KB on Linux, bytes on macOS)."""
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return rss / (1024 * 1024) if sys.platform == "darwin" else rss / 1024
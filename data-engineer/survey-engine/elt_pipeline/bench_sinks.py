@@ -0,0 +1,80 @@
+"""
+Benchmark the Postgres sinks against a local database: row-at-a-time
+executemany (PostgresSink) vs COPY FROM STDIN + set-based merge (PostgresCopySink),
+each with a connection per batch or through the connection pool (PooledPostgresSink).
+
+Rows are written with a BENCH_ id prefix and deleted afterwards, so the
+benchmark can run against the warehouse started by docker-compose:
+
+    docker compose up -d warehouse
+
+Usage:
+    DB_USER=... DB_PASSWORD=... DB_NAME=... DB_HOST=localhost python bench_sinks.py
+    python bench_sinks.py --dsn "dbname=surveys user=me host=localhost" --records 50000
+    python bench_sinks.py --batch_sizes 100 1000 10000 --sinks copy pooled-copy
+"""
+
+import argparse
+import time
+from pathlib import Path
+
+import psycopg2
+
+from bench_common import synthetic_records
+from ingest import (PooledPostgresSink, PostgresCopySink, PostgresSink, SurveyIngestor,
+                    batch_iterator, conn_string_from_env)
+
+## Config -----------------------------
+RECORDS     = 20_000
+BATCH_SIZES = [100, 1_000]
+SINKS       = {
+    "insert":        PostgresSink,
+    "copy":          PostgresCopySink,
+    "pooled-insert": lambda dsn: PooledPostgresSink(dsn, writer="insert"),
+    "pooled-copy":   lambda dsn: PooledPostgresSink(dsn, writer="copy"),
+}
+ID_PREFIX   = "BENCH_"
+
+
+## Helpers -----------------------------
+def delete_bench_rows(dsn: str) -> None:
+    with psycopg2.connect(dsn) as conn:
+        with conn.cursor() as cur:
+            cur.execute("DELETE FROM staging_survey_responses WHERE respondent_id LIKE %s;", (ID_PREFIX + "%",))
+
+
+def run(dsn: str, sink_name: str, records: int, batch_size: int) -> float:
+    ingestor = SurveyIngestor(Path("/dev/null"))
+    responses = [ingestor.parse_record(raw) for raw in synthetic_records(records, id_prefix=ID_PREFIX)]
+    sink = SINKS[sink_name](dsn)
+
+    delete_bench_rows(dsn)
+    t0 = time.perf_counter()
+    for batch in batch_iterator(responses, batch_size):
+        sink.save_batch(batch)
+    elapsed = time.perf_counter() - t0
+    if isinstance(sink, PooledPostgresSink):
+        print(f"    {sink_name}: {sink.stats.report()}")
+        sink.close()
+    delete_bench_rows(dsn)
+    return elapsed
+
+
+## Main -----------------------------
+def main(dsn: str, records: int, batch_sizes: list[int], sinks: list[str]):
+    print(f"{'sink':>13} {'batch':>7} {'records':>9} {'seconds':>8} {'rec/s':>11}")
+    for batch_size in batch_sizes:
+        for sink_name in sinks:
+            elapsed = run(dsn, sink_name, records, batch_size)
+            print(f"{sink_name:>13} {batch_size:>7,} {records:>9,} {elapsed:>8.2f} {records / elapsed:>11,.0f}", flush=True)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Throughput of the Postgres sinks")
+    parser.add_argument("--dsn",         default=None, help="libpq DSN (default: built from DB_* env vars)")
+    parser.add_argument("--records",     default=RECORDS, type=int, help="Records per run")
+    parser.add_argument("--batch_sizes", default=BATCH_SIZES, type=int, nargs="+", help="Records per save_batch")
+    parser.add_argument("--sinks",       default=list(SINKS), nargs="+", choices=list(SINKS), help="Sinks to compare")
+    args = parser.parse_args()
+
+    main(args.dsn or conn_string_from_env(), args.records, args.batch_sizes, args.sinks)
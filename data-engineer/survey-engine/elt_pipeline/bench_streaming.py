@@ -0,0 +1,93 @@
+"""
+Benchmark the raw-record readers of SurveyIngestor: peak RSS and records/sec
+against input size, for the legacy json.load path and the incremental parsers.
+
+Every measurement runs in a fresh interpreter so peak RSS is not polluted by
+earlier runs.
+
+Usage:
+    python bench_streaming.py
+    python bench_streaming.py --records 100000 1000000 --modes load array ndjson
+    python bench_streaming.py --workdir /tmp/survey-bench --keep
+"""
+
+import argparse
+import json
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+from bench_common import peak_rss_mb, write_synthetic_file
+
+## Config -----------------------------
+RECORDS = [10_000, 100_000, 1_000_000]
+MODES   = ["load", "array", "ndjson"]
+
+
+## Child: one measurement -----------------------------
+def run_child(path: Path, mode: str) -> None:
+    from ingest import SurveyIngestor
+
+    ingestor = SurveyIngestor(path, fmt=mode)
+    t0 = time.perf_counter()
+    n = sum(1 for _ in ingestor.stream_raw_records())
+    elapsed = time.perf_counter() - t0
+    print(json.dumps({"records": n, "seconds": elapsed, "peak_rss_mb": peak_rss_mb()}))
+
+
+def measure(path: Path, mode: str) -> dict:
+    out = subprocess.run(
+        [sys.executable, __file__, "--child", str(path), mode],
+        check=True, capture_output=True, text=True, cwd=Path(__file__).parent,
+    )
+    return json.loads(out.stdout)
+
+
+## Main -----------------------------
+def main(records: list[int], modes: list[str], workdir: Path | None, keep: bool):
+    # A fresh directory per run unless one is given, so concurrent runs never share (or delete) files
+    own_dir = workdir is None
+    workdir = Path(tempfile.mkdtemp(prefix="survey-bench-")) if own_dir else workdir
+    written = []
+    print(f"{'records':>10} {'mode':>7} {'file MB':>9} {'seconds':>8} {'rec/s':>11} {'peak RSS MB':>12}")
+    try:
+        for n in records:
+            files = {
+                "array":  write_synthetic_file(workdir / f"surveys_{n}.json", n, "array"),
+                "ndjson": write_synthetic_file(workdir / f"surveys_{n}.ndjson", n, "ndjson"),
+            }
+            written.extend(files.values())
+            for mode in modes:
+                path = files["ndjson" if mode == "ndjson" else "array"]
+                r = measure(path, mode)
+                size_mb = path.stat().st_size / 1e6
+                print(
+                    f"{r['records']:>10,} {mode:>7} {size_mb:>9.1f} {r['seconds']:>8.2f} "
+                    f"{r['records'] / r['seconds']:>11,.0f} {r['peak_rss_mb']:>12.1f}",
+                    flush=True,
+                )
+    finally:
+        if keep:
+            print(f"Synthetic files kept in {workdir}")
+        elif own_dir:
+            shutil.rmtree(workdir, ignore_errors=True)
+        else:
+            for path in written:   # only this run's files: the directory may hold anything else
+                path.unlink(missing_ok=True)
+
+if __name__ == "__main__":
+    if len(sys.argv) == 4 and sys.argv[1] == "--child":
+        run_child(Path(sys.argv[2]), sys.argv[3])
+        sys.exit(0)
+
+    parser = argparse.ArgumentParser(description="Peak RSS and throughput of the survey readers")
+    parser.add_argument("--records", nargs="+", type=int, default=RECORDS, help="Input sizes (records)")
+    parser.add_argument("--modes",   nargs="+", default=MODES, choices=MODES, help="Reader modes")
+    parser.add_argument("--workdir", default=None, type=Path, help="Where to write synthetic files (default: a fresh temp dir)")
+    parser.add_argument("--keep",    action="store_true", help="Keep the synthetic files afterwards")
+    args = parser.parse_args()
+
+    main(args.records, args.modes, args.workdir, args.keep)
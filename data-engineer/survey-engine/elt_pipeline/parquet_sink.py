@@ -0,0 +1,184 @@
+import json
+import re
+import threading
+import uuid
+import zlib
+from pathlib import Path
+from typing import Iterable, Iterator, Optional
+
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from ingest import SurveyResponse
+
+BASE_COLUMNS = ("respondent_id", "age", "location", "timestamp", "raw_version", "answers")
+ANSWER_PREFIX = "answer_"
+
+def answer_column(key: str) -> str:
+    """
+    answer_<key>. A key that is not a plain identifier gets its non-word characters
+    replaced and a crc32 suffix of the original key, so "q-1" and "q.1" keep separate
+    columns, and a key maps to the same column in every batch.
+    """
+    key = str(key)
+    name = re.sub(r"\W", "_", key)
+    if name != key:
+        name += f"_{zlib.crc32(key.encode()):08x}"
+    return ANSWER_PREFIX + name
+
+def infer_answer_type(values: list) -> pa.DataType:
+    """Narrowest Arrow type holding every non-null value; mixed or nested answers fall back to JSON text."""
+    present = [v for v in values if v is not None]
+    if present and all(isinstance(v, bool) for v in present):
+        return pa.bool_()
+    if present and all(isinstance(v, int) and not isinstance(v, bool) for v in present):
+        return pa.int64()
+    if present and all(isinstance(v, (int, float)) and not isinstance(v, bool) for v in present):
+        return pa.float64()
+    return pa.string()
+
+def as_text(value) -> Optional[str]:
+    return value if value is None or isinstance(value, str) else json.dumps(value)
+
+def responses_to_table(records: list[SurveyResponse]) -> pa.Table:
+    """
+    One row per response: the respondent columns, the raw answers as JSON text,
+    and one typed answer_<key> column per answer key seen in the batch.
+    """
+    columns = {
+        "respondent_id": pa.array([str(r.respondent.id) for r in records], pa.string()),
+        "age":           pa.array([r.respondent.age for r in records], pa.int64()),
+        "location":      pa.array([r.respondent.location for r in records], pa.string()),
+        "timestamp":     pa.array([r.timestamp for r in records], pa.string()),
+        "raw_version":   pa.array([r.version for r in records], pa.string()),
+        "answers":       pa.array([json.dumps(r.answers) for r in records], pa.string()),
+    }
+    keys = sorted({key for r in records for key in r.answers}, key=str)
+    for key in keys:
+        values = [r.answers.get(key) for r in records]
+        dtype = infer_answer_type(values)
+        if dtype == pa.string():
+            values = [as_text(v) for v in values]
+        column = answer_column(key)
+        if column in columns:
+            # Never silently overwrite another key's answers
+            raise ValueError(f"Answer key {key!r} maps to column {column!r}, which is already taken")
+        columns[column] = pa.array(values, dtype)
+    return pa.table(columns)
+
+def conform(table: pa.Table, schema: pa.Schema) -> Optional[pa.Table]:
+    """Reshape table to an open file's schema (missing answer columns become nulls), or None if it cannot fit."""
+    if not set(table.column_names) <= set(schema.names):
+        return None
+    arrays = []
+    for field in schema:
+        if field.name not in table.column_names:
+            arrays.append(pa.nulls(table.num_rows, field.type))
+        elif table.schema.field(field.name).type == field.type or table[field.name].null_count == table.num_rows:
+            arrays.append(table[field.name].cast(field.type))
+        elif pa.types.is_int64(table.schema.field(field.name).type) and pa.types.is_float64(field.type):
+            arrays.append(table[field.name].cast(field.type))
+        else:
+            return None
+    return pa.Table.from_arrays(arrays, schema=schema)
+
+class _PartitionFile:
+    def __init__(self, directory: Path, schema: pa.Schema, compression: str):
+        directory.mkdir(parents=True, exist_ok=True)
+        self.path = directory / f"part-{uuid.uuid4().hex[:12]}.parquet"
+        self.tmp_path = self.path.with_suffix(".parquet.tmp")
+        self.writer = pq.ParquetWriter(self.tmp_path, schema, compression=compression)
+        self.schema = schema
+        self.rows = 0
+
+    def write(self, table: pa.Table) -> None:
+        self.writer.write_table(table)
+        self.rows += table.num_rows
+
+    def close(self) -> None:
+        # Readers only ever see complete files
+        self.writer.close()
+        self.tmp_path.rename(self.path)
+
+class ParquetSink:
+    """
+    Columnar DataSink: writes SurveyResponse batches to Hive-partitioned Parquet
+    files (root/raw_version=v1/part-*.parquet) so dbt models and analysts can
+    scan staging data without going through Postgres row storage.
+
+    Batches are buffered per partition into row groups of row_group_size rows,
+    and files roll over after rows_per_file rows or when the answer columns of
+    a row group no longer fit the open file's schema. Use it as a context
+    manager (or call close()) so the last row groups are flushed.
+    """
+    def __init__(self, root: Path, partition_by: str = "raw_version", row_group_size: int = 50_000,
+                 rows_per_file: int = 1_000_000, compression: str = "zstd"):
+        self.root = Path(root)
+        self.partition_by = partition_by
+        self.row_group_size = row_group_size
+        self.rows_per_file = rows_per_file
+        self.compression = compression
+        self._buffers: dict[str, list[SurveyResponse]] = {}
+        self._files: dict[str, _PartitionFile] = {}
+        self._lock = threading.Lock()
+
+    def _partition(self, record: SurveyResponse) -> str:
+        value = record.version if self.partition_by == "raw_version" else getattr(record, self.partition_by)
+        return f"{self.partition_by}={value}"
+
+    def save_batch(self, records: Iterable[SurveyResponse], checkpoint=None) -> None:
+        if checkpoint is not None:
+            raise ValueError("ParquetSink cannot commit a checkpoint atomically with its files")
+        with self._lock:
+            for r in records:
+                self._buffers.setdefault(self._partition(r), []).append(r)
+            for partition in [p for p, buffered in self._buffers.items() if len(buffered) >= self.row_group_size]:
+                self._flush(partition)
+
+    def _flush(self, partition: str) -> None:
+        buffered = self._buffers.pop(partition, [])
+        if not buffered:
+            return
+        table = responses_to_table(buffered)
+        file = self._files.get(partition)
+        conformed = conform(table, file.schema) if file is not None else None
+        if conformed is None:
+            if file is not None:
+                file.close()
+            file = self._files[partition] = _PartitionFile(self.root / partition, table.schema, self.compression)
+            conformed = table
+        file.write(conformed)
+        if file.rows >= self.rows_per_file:
+            file.close()
+            del self._files[partition]
+
+    def close(self) -> None:
+        with self._lock:
+            for partition in list(self._buffers):
+                self._flush(partition)
+            for file in self._files.values():
+                file.close()
+            self._files.clear()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+def iter_parquet_batches(root: Path, columns: Optional[list[str]] = None,
+                         batch_size: int = 65_536) -> Iterator[pa.RecordBatch]:
+    """
+    Stream a ParquetSink directory back as record batches, one file at a time, so
+    memory is bounded by batch_size rather than the dataset. Hive partition values
+    are attached as string columns; answer columns may differ between files.
+    """
+    for path in sorted(Path(root).rglob("*.parquet")):
+        partitions = dict(part.split("=", 1) for part in path.relative_to(root).parts[:-1] if "=" in part)
+        parquet_file = pq.ParquetFile(path)
+        file_columns = None if columns is None else [c for c in columns if c in parquet_file.schema_arrow.names]
+        for batch in parquet_file.iter_batches(batch_size=batch_size, columns=file_columns):
+            for name, value in partitions.items():
+                if name not in batch.schema.names and (columns is None or name in columns):
+                    batch = batch.append_column(name, pa.array([value] * batch.num_rows, pa.string()))
+            yield batch
@@ -0,0 +1,11 @@
+CREATE TABLE IF NOT EXISTS dead_letter_survey_records (
+    id BIGSERIAL PRIMARY KEY,
+    source_file TEXT,
+    byte_offset BIGINT,
+    reason TEXT,
+    raw_record TEXT,
+    rejected_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+-- A resumed load re-parses the batch in flight when it stopped: keep each rejected record once
+CREATE UNIQUE INDEX IF NOT EXISTS dead_letter_survey_records_source_offset
+    ON dead_letter_survey_records (source_file, byte_offset);
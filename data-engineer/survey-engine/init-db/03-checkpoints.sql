@@ -0,0 +1,10 @@
+CREATE TABLE IF NOT EXISTS ingest_checkpoints (
+    source_file TEXT,
+    lane INTEGER,
+    lanes INTEGER,
+    byte_offset BIGINT,
+    batch_seq BIGINT,
+    source_identity TEXT,
+    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    PRIMARY KEY (source_file, lane)
+);
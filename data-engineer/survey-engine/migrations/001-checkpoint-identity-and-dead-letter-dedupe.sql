@@ -0,0 +1,11 @@
+-- Upgrades a warehouse volume created before checkpoints recorded the source file's identity
+-- and before dead letters were deduplicated (init-db/ only runs on a fresh volume):
+--   docker compose exec -T warehouse psql -U "$DB_USER" -d "$DB_NAME" < migrations/001-checkpoint-identity-and-dead-letter-dedupe.sql
+ALTER TABLE ingest_checkpoints ADD COLUMN IF NOT EXISTS source_identity TEXT;
+
+-- Keep the first copy of any dead letter a resumed load wrote twice, then forbid duplicates
+DELETE FROM dead_letter_survey_records d
+USING dead_letter_survey_records keep
+WHERE d.source_file = keep.source_file AND d.byte_offset = keep.byte_offset AND d.id > keep.id;
+CREATE UNIQUE INDEX IF NOT EXISTS dead_letter_survey_records_source_offset
+    ON dead_letter_survey_records (source_file, byte_offset);
@@ -0,0 +1,172 @@
+"""
+Selective activation checkpointing and a memory-budget planner.
+
+A checkpointed transformer block keeps only its input during the forward pass
+and recomputes its internals during backward: per sample, the block's saved
+activations shrink to one [seq_len, hidden] tensor, at the cost of running its
+forward twice. checkpoint_blocks() does that for any subset of blocks, without
+changing parameter names (state dicts and checkpoints are unaffected).
+
+The planner measures instead of guessing: two forward passes (batch 1 and 2
+at seq_len) record every tensor autograd saves, attributed to the block that
+saved it, which splits activation memory into per block / rest and per sample
+/ fixed. With the per-rank state (params, grads, AdamW moments and the DDP
+buckets or FSDP's unsharded block) it then picks the largest micro-batch size
+that fits the budget, with the fewest checkpointed blocks that make it fit.
+The effective batch (micro-batch x accumulation steps) is kept.
+
+Estimates cover tensors saved for backward; HEADROOM of the budget is left for
+the CUDA context, communication buffers and allocator fragmentation. The
+measured peak memory is in every metrics line, for comparison.
+"""
+
+from collections import defaultdict
+
+import numpy as np
+import torch
+from torch.utils.checkpoint import checkpoint
+
+from sharding import local_tensor, transformer_blocks
+
+HEADROOM = 0.10
+CACHE_KWARGS = ("past_key_values", "past_key_value")
+# Recomputing a block's forward costs about 1/3 of its forward + backward
+RECOMPUTE_COST = 1 / 3
+
+
+## Checkpointing -----------------------------
+def checkpoint_blocks(model: torch.nn.Module, layers) -> None:
+    """Recompute the given blocks (indices into transformer_blocks(model)) in backward instead of storing them."""
+    blocks = transformer_blocks(model)
+    for i in layers:
+        forward = blocks[i].forward
+
+        def checkpointed(*args, _forward=forward, **kwargs):
+            if not torch.is_grad_enabled():   # eval: nothing to save anyway
+                return _forward(*args, **kwargs)
+            # Like HF's own gradient checkpointing: the recompute must not append to a KV cache again
+            kwargs.update({k: None for k in CACHE_KWARGS if k in kwargs}, use_cache=False)
+            return checkpoint(_forward, *args, use_reentrant=False, **kwargs)
+        blocks[i].forward = checkpointed
+
+
+def spread(k: int, n: int) -> list[int]:
+    """k of n block indices, evenly spaced."""
+    return sorted(set(np.linspace(0, n - 1, k).round().astype(int).tolist())) if k else []
+
+
+## Profiling -----------------------------
+def profile_activations(model: torch.nn.Module, seq_len: int, device: torch.device) -> dict:
+    """
+    Bytes saved for backward by each block and by the rest of the model (embeddings,
+    final norm, LM head, loss), per sample and fixed, at seq_len. Forward passes only.
+    """
+    blocks = transformer_blocks(model)
+    owner = [None]   # index of the block currently running, None outside blocks
+
+    def saved_bytes(batch_size: int) -> dict:
+        seen, saved = set(), defaultdict(int)
+
+        def pack(t):
+            storage = t.untyped_storage()
+            if storage.data_ptr() not in seen:   # views and re-saved tensors count once
+                seen.add(storage.data_ptr())
+                saved[owner[0]] += storage.nbytes()
+            return t
+
+        hooks = [b.register_forward_pre_hook(lambda m, a, i=i: owner.__setitem__(0, i)) for i, b in enumerate(blocks)]
+        hooks += [b.register_forward_hook(lambda m, a, o: owner.__setitem__(0, None)) for b in blocks]
+        ids = torch.randint(1, model.config.vocab_size, (batch_size, seq_len), device=device)
+        try:
+            with torch.autograd.graph.saved_tensors_hooks(pack, lambda t: t):
+                with torch.autocast(device_type=device.type, dtype=torch.bfloat16):
+                    model(input_ids=ids, labels=ids)   # loss included: the logits are often the largest tensor
+        finally:
+            for h in hooks:
+                h.remove()
+        return saved
+
+    model.train()
+    one, two = saved_bytes(1), saved_bytes(2)
+    owners = set(one) | set(two)
+    param = next(model.parameters())
+    return {
+        "seq_len":     seq_len,
+        "blocks":      [two[i] - one[i] for i in range(len(blocks))],     # per sample
+        "other":       two[None] - one[None],                             # per sample
+        "fixed":       max(0, sum(2 * one[k] - two[k] for k in owners)),  # e.g. autocast weight copies
+        "block_input": seq_len * model.config.hidden_size * param.element_size(),
+    }
+
+
+def state_bytes(model: torch.nn.Module, fsdp: bool) -> float:
+    """This rank's params, grads and AdamW moments, plus DDP's gradient buckets or FSDP's unsharded block."""
+    local = sum(local_tensor(p).numel() * p.element_size() for p in model.parameters())
+    total = 4 * local   # param + grad + exp_avg + exp_avg_sq
+    if fsdp:
+        # One block's full weights and gradients exist while it runs (numel of a DTensor is the global size)
+        total += 2 * max(sum(p.numel() * p.element_size() for p in b.parameters()) for b in transformer_blocks(model))
+    else:
+        total += local   # DDP reduces gradients through bucket copies
+    return total
+
+
+## Planning -----------------------------
+def default_budget_gb(device: torch.device) -> float:
+    if device.type != "cuda":
+        raise ValueError("set a memory budget explicitly when not training on a GPU")
+    return torch.cuda.get_device_properties(device).total_memory / 1e9
+
+
+def estimate_peak(profile: dict, static: float, batch_size: int, layers) -> float:
+    layers = set(layers)
+    per_sample = profile["other"] + sum(
+        profile["block_input"] if i in layers else b for i, b in enumerate(profile["blocks"])
+    )
+    # In backward, one checkpointed block at a time is rematerialized
+    recompute = max((profile["blocks"][i] for i in layers), default=0)
+    return static + profile["fixed"] + batch_size * (per_sample + recompute)
+
+
+def plan_checkpointing(profile: dict, static: float, budget: float, batch_sizes, max_layers: int | None = None):
+    """Largest batch size that fits the budget, with the fewest checkpointed blocks; None if nothing fits."""
+    n = len(profile["blocks"])
+    for batch_size in sorted(batch_sizes, reverse=True):
+        for k in range((n if max_layers is None else min(n, max_layers)) + 1):
+            peak = estimate_peak(profile, static, batch_size, spread(k, n))
+            if peak <= budget:
+                return {"batch_size": batch_size, "layers": spread(k, n), "peak": peak}
+    return None
+
+
+def apply_memory_plan(model: torch.nn.Module, budget_gb: float, batch_size: int, grad_accum_steps: int,
+                      seq_len: int, device: torch.device, fsdp: bool = False) -> tuple[int, int, str]:
+    """
+    Profile, plan and checkpoint the chosen blocks. Returns the micro-batch size and accumulation
+    steps to train with (their product is batch_size x grad_accum_steps) and a report of the trade-off.
+    """
+    effective = batch_size * grad_accum_steps
+    candidates = [b for b in range(1, effective + 1) if effective % b == 0]
+    profile = profile_activations(model, seq_len, device)
+    static = state_bytes(model, fsdp)
+    budget = budget_gb * 1e9 * (1 - HEADROOM)
+
+    plan = plan_checkpointing(profile, static, budget, candidates)
+    if plan is None:
+        need = estimate_peak(profile, static, 1, range(len(profile["blocks"])))
+        raise RuntimeError(f"micro-batch 1 with every block checkpointed needs ~{need / 1e9:.1f} GB, "
+                           f"over the {budget_gb:.1f} GB budget (less {HEADROOM:.0%} headroom)")
+    checkpoint_blocks(model, plan["layers"])
+
+    n, k = len(profile["blocks"]), len(plan["layers"])
+    baseline = plan_checkpointing(profile, static, budget, candidates, max_layers=0)
+    baseline_str = (f"micro-batch {baseline['batch_size']} x {effective // baseline['batch_size']} accum "
+                    f"without checkpointing" if baseline else "does not fit without checkpointing")
+    report = (
+        f"activation checkpointing | budget {budget_gb:.1f} GB ({HEADROOM:.0%} headroom) "
+        f"| plan: micro-batch {plan['batch_size']} x {effective // plan['batch_size']} accum, "
+        f"recompute {k}/{n} blocks {plan['layers']} "
+        f"| est. peak {plan['peak'] / 1e9:.1f} GB (states {static / 1e9:.1f} GB) "
+        f"| {baseline_str} | recompute cost ~+{k / n * RECOMPUTE_COST:.0%} block compute per sample"
+    )
+    return plan["batch_size"], effective // plan["batch_size"], report
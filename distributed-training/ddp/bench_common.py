@@ -0,0 +1,140 @@
+"""
+Shared helpers for the CPU benchmarks: a tiny randomly initialized Llama,
+synthetic tokenized datasets with a dialog-like length distribution, so the
+benchmarks run anywhere without downloading a model or dataset, and the
+scaffolding for running the Trainer on forked gloo ranks.
+"""
+
+import contextlib
+import io
+import os
+import socket
+import tempfile
+
+import numpy as np
+import torch
+import torch.distributed as dist
+import torch.multiprocessing as mp
+from torch.optim.lr_scheduler import LambdaLR
+from torch.utils.data import Dataset
+from transformers import LlamaConfig, LlamaForCausalLM
+
+from fine_tuning_ddp import Trainer, ddp_setup, prepare_dataloader, prepare_eval_dataloader
+from packing import IGNORE_INDEX
+
+VOCAB_SIZE = 1_024
+PAD_ID     = 0
+
+
+## Model -----------------------------
+def tiny_llama(hidden_size: int = 128, num_layers: int = 2, vocab_size: int = VOCAB_SIZE,
+               max_seq_len: int = 1_024, seed: int = 0, attn_implementation: str = "sdpa") -> LlamaForCausalLM:
+    torch.manual_seed(seed)
+    config = LlamaConfig(
+        vocab_size=vocab_size,
+        hidden_size=hidden_size,
+        intermediate_size=hidden_size * 4,
+        num_hidden_layers=num_layers,
+        num_attention_heads=max(1, hidden_size // 32),
+        num_key_value_heads=max(1, hidden_size // 64),
+        max_position_embeddings=max_seq_len,
+        pad_token_id=PAD_ID,
+        attn_implementation=attn_implementation,
+    )
+    return LlamaForCausalLM(config)
+
+
+## Data -----------------------------
+def synthetic_lengths(n: int, max_seq_len: int, seed: int = 0, median: int = 180, sigma: float = 0.7) -> np.ndarray:
+    """Log-normal sequence lengths, like chat-templated support dialogs: many short, a long tail."""
+    rng = np.random.default_rng(seed)
+    return np.clip(rng.lognormal(np.log(median), sigma, n).astype(np.int64), 16, max_seq_len)
+
+
+class SyntheticTokenDataset(Dataset):
+    """Random token ids with given lengths; same item interface and `lengths` as TokenCacheDataset."""
+    def __init__(self, lengths, vocab_size: int = VOCAB_SIZE, seed: int = 0):
+        self.lengths = np.asarray(lengths)
+        self.vocab_size = vocab_size
+        self.seed = seed
+
+    def __len__(self):
+        return len(self.lengths)
+
+    def __getitem__(self, idx):
+        rng = np.random.default_rng((self.seed, int(idx)))
+        return {"input_ids": rng.integers(1, self.vocab_size, self.lengths[idx])}
+
+
+class PatternTokenDataset(SyntheticTokenDataset):
+    """Arithmetic sequences mod vocab_size (random start and stride): learnable, so losses can be compared."""
+    def __getitem__(self, idx):
+        rng = np.random.default_rng((self.seed, int(idx)))
+        start, stride = rng.integers(1, self.vocab_size), rng.integers(1, 9)
+        ids = (start + stride * np.arange(self.lengths[idx])) % (self.vocab_size - 1) + 1   # never PAD_ID
+        return {"input_ids": ids}
+
+
+def pad_collate(features, pad_token_id: int = PAD_ID):
+    """Dynamic padding to the longest example, like DataCollatorForLanguageModeling(mlm=False)."""
+    length = max(len(f["input_ids"]) for f in features)
+    input_ids = torch.full((len(features), length), pad_token_id, dtype=torch.long)
+    attention_mask = torch.zeros((len(features), length), dtype=torch.long)
+    for row, f in enumerate(features):
+        n = len(f["input_ids"])
+        input_ids[row, :n] = torch.as_tensor(np.asarray(f["input_ids"], dtype=np.int64))
+        attention_mask[row, :n] = 1
+    labels = input_ids.masked_fill(attention_mask == 0, IGNORE_INDEX)
+    return {"input_ids": input_ids, "attention_mask": attention_mask, "labels": labels}
+
+
+## Trainer -----------------------------
+@contextlib.contextmanager
+def quiet_trainer(model, train_set, eval_set, batch_size: int, eval_batch_size: int | None = None,
+                  optimizer=None, lr: float = 1e-4, metrics: bool = False, trainer_cls=Trainer, **trainer_kwargs):
+    """
+    A Trainer for one benchmark run, with its output silenced: pad-collated loaders, a constant
+    learning rate (AdamW unless `optimizer` is given), snapshots and, with metrics=True, rank 0's
+    metrics file in a temporary directory that is removed on exit. Other keyword arguments go to
+    the Trainer.
+    """
+    optimizer = optimizer or torch.optim.AdamW(model.parameters(), lr=lr)
+    scheduler = LambdaLR(optimizer, lambda step: 1.0)
+    train_data = prepare_dataloader(train_set, batch_size, pad_collate, shuffle=True)
+    eval_data  = prepare_eval_dataloader(eval_set, eval_batch_size or batch_size, pad_collate)
+    with tempfile.TemporaryDirectory() as tmp, contextlib.redirect_stdout(io.StringIO()):
+        metrics_file = os.path.join(tmp, "metrics.jsonl") if metrics and dist.get_rank() == 0 else None
+        yield trainer_cls(model, train_data, eval_data, optimizer, scheduler, save_every=1,
+                          snapshot_path=os.path.join(tmp, "snapshots"), metrics_file=metrics_file, **trainer_kwargs)
+
+
+## Launch -----------------------------
+def free_port() -> int:
+    """A loopback port that is free right now, so concurrent benchmark runs never share a rendezvous."""
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def _rank_main(rank: int, fn, world_size: int, port: int, args):
+    os.environ.update(RANK=str(rank), LOCAL_RANK=str(rank), WORLD_SIZE=str(world_size),
+                      MASTER_ADDR="127.0.0.1", MASTER_PORT=str(port))
+    ddp_setup()
+    try:
+        fn(rank, world_size, *args)
+    finally:
+        dist.destroy_process_group()
+
+
+def spawn(fn, world_size: int, *args):
+    """
+    Run fn(rank, world_size, *args) on world_size fresh processes inside one process group
+    (gloo on CPU, NCCL on GPUs) with its own free port. Forked, like torchrun's workers:
+    spawned ranks would also spawn their DataLoader workers, re-importing torch on every epoch.
+    """
+    mp.start_processes(_rank_main, args=(fn, world_size, free_port(), args), nprocs=world_size, start_method="fork")
+
+
+def result_queue():
+    """A queue the forked ranks can put results on."""
+    return mp.get_context("fork").SimpleQueue()
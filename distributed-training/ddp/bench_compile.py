@@ -0,0 +1,96 @@
+"""
+Eager vs compiled (--compile) Trainer on CPU with the gloo backend (or on GPUs
+with NCCL when available), training a small randomly initialized Llama on
+synthetic data with dialog-like (variable) lengths.
+
+Modes, each in fresh processes so no compiled code is carried over:
+
+  eager          stock AdamW
+  eager_fused    fused AdamW
+  compile_cold   torch.compile + fused AdamW, empty compile cache
+  compile_warm   the same again, reusing compile_cold's cache (a restarted job)
+
+Every optimizer step is its own metrics window. Reports:
+
+  step ms    median step time (steady state)
+  overhead   total time minus steps x median: compilation and recompiles
+             (dynamo makes the sequence length dynamic after the first one)
+  first s    the first step, the warm-up a restarted job waits for
+  graphs, breaks   from dynamo's counters (compiled modes)
+
+Usage:
+    python bench_compile.py
+    python bench_compile.py --steps 50 --hidden_size 512 --modes eager,compile_cold,compile_warm
+"""
+
+import argparse
+import json
+import statistics
+import tempfile
+
+import torch
+
+from bench_common import SyntheticTokenDataset, quiet_trainer, result_queue, spawn, synthetic_lengths, tiny_llama
+from compilation import adamw, enable_compile_cache
+
+## Config -----------------------------
+WORLD_SIZE  = 1
+STEPS       = 30
+BATCH_SIZE  = 4
+MAX_SEQ_LEN = 256
+HIDDEN_SIZE = 256
+NUM_LAYERS  = 4
+MODES       = "eager,eager_fused,compile_cold,compile_warm"
+
+
+## Worker -----------------------------
+def worker(rank: int, world_size: int, mode: str, cache_dir: str, args, results):
+    compiled = mode.startswith("compile")
+    if compiled:
+        enable_compile_cache(cache_dir)
+    train_set = SyntheticTokenDataset(synthetic_lengths(args.steps * args.batch_size * world_size, args.max_seq_len))
+    eval_set  = SyntheticTokenDataset(synthetic_lengths(world_size, args.max_seq_len, seed=1))
+
+    model = tiny_llama(args.hidden_size, args.num_layers, max_seq_len=args.max_seq_len)
+    optimizer = adamw(model.parameters(), 1e-4, "default" if mode == "eager" else "fused")
+    # One metrics window per optimizer step
+    with quiet_trainer(model, train_set, eval_set, args.batch_size, eval_batch_size=1, optimizer=optimizer,
+                       metrics=True, compiled=compiled, logging_steps=1) as trainer:
+        trainer._run_epoch(0)
+        if rank == 0:
+            with open(trainer.metrics.metrics_file) as fh:
+                step_s = [json.loads(line)["window_s"] for line in fh]
+
+    if rank == 0:
+        from torch._dynamo.utils import counters
+        median = statistics.median(step_s)
+        results.put((mode, median, sum(step_s) - len(step_s) * median, step_s[0],
+                     counters["stats"]["unique_graphs"], sum(counters["graph_break"].values())))
+
+
+## Main -----------------------------
+def main(args):
+    results = result_queue()
+    with tempfile.TemporaryDirectory() as cache_dir:
+        for mode in args.modes.split(","):
+            spawn(worker, args.world_size, mode, cache_dir, args, results)
+    print(f"world_size={args.world_size} backend={'nccl' if torch.cuda.is_available() else 'gloo'} "
+          f"hidden={args.hidden_size} layers={args.num_layers} steps={args.steps}")
+    print(f"{'mode':>13} {'step ms':>8} {'overhead s':>11} {'first s':>8} {'graphs':>7} {'breaks':>7}")
+    while not results.empty():
+        mode, step_s, overhead_s, first_s, graphs, breaks = results.get()
+        print(f"{mode:>13} {step_s * 1e3:>8.1f} {overhead_s:>11.1f} {first_s:>8.1f} {graphs:>7} {breaks:>7}", flush=True)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Eager vs torch.compile step time and compile overhead")
+    parser.add_argument("--modes",       default=MODES,       help="Comma-separated subset of the modes above")
+    parser.add_argument("--world_size",  default=WORLD_SIZE,  type=int, help="Processes (gloo on CPU)")
+    parser.add_argument("--steps",       default=STEPS,       type=int, help="Optimizer steps per mode")
+    parser.add_argument("--batch_size",  default=BATCH_SIZE,  type=int, help="Per-rank batch size")
+    parser.add_argument("--max_seq_len", default=MAX_SEQ_LEN, type=int, help="Longest synthetic example")
+    parser.add_argument("--hidden_size", default=HIDDEN_SIZE, type=int, help="Model width")
+    parser.add_argument("--num_layers",  default=NUM_LAYERS,  type=int, help="Model depth")
+    args = parser.parse_args()
+
+    main(args)
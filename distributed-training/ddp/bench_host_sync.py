@@ -0,0 +1,115 @@
+"""
+Benchmark the Trainer's loss logging and evaluation with and without
+per-step host syncs, on CPU with the gloo backend (or on GPUs with NCCL when
+available) and a tiny randomly initialized Llama.
+
+  sync       the previous behaviour: loss.item() + an extra all_reduce on every
+             logging step, outputs.loss.item() on every eval batch, eval loss
+             = mean over batches
+  on-device  Trainer as is: losses accumulated on the device, one read-back per
+             log line / eval, eval loss weighted by target tokens
+
+Reports per-step training time, eval time and both eval losses: with dynamic
+padding the batch mean over-weights tokens in short batches, and the gap
+between the two numbers is that bias. On CPU there is no asynchronous device
+queue to stall, so expect the step-time difference to be small there.
+
+Usage:
+    python bench_host_sync.py
+    python bench_host_sync.py --world_size 4 --examples 512 --logging_steps 1
+"""
+
+import argparse
+import time
+
+import torch
+import torch.distributed as dist
+
+from bench_common import SyntheticTokenDataset, quiet_trainer, result_queue, spawn, synthetic_lengths, tiny_llama
+from fine_tuning_ddp import Trainer
+
+## Config -----------------------------
+WORLD_SIZE    = 2
+EXAMPLES      = 256
+BATCH_SIZE    = 4
+MAX_SEQ_LEN   = 512
+LOGGING_STEPS = 1
+
+
+## Baseline: the previous per-step host syncs -----------------------------
+class SyncingTrainer(Trainer):
+    def _run_batch(self, batch, micro_step):
+        is_accum = (micro_step + 1) % self.grad_accum_steps != 0
+        sync_ctx = self.model.no_sync() if is_accum else torch.enable_grad()
+        with sync_ctx:
+            with torch.autocast(device_type=self.device.type, dtype=torch.bfloat16):
+                loss = self.model(**batch).loss / self.grad_accum_steps
+            loss.backward()
+        if not is_accum:
+            self.optimizer.step()
+            self.scheduler.step()
+            self.optimizer.zero_grad(set_to_none=True)
+            self.global_step += 1
+            if self.global_step % self.logging_steps == 0:
+                loss_t = torch.tensor(loss.item() * self.grad_accum_steps, device=self.device)
+                dist.all_reduce(loss_t, op=dist.ReduceOp.AVG)
+                self.metrics.flush(self.global_step, self.epoch, self.scheduler.get_last_lr()[0], loss_t, self.device)
+
+    def _run_eval(self):
+        self.model.eval()
+        total_loss, n = 0.0, 0
+        with torch.no_grad():
+            for batch in self.eval_data:
+                batch = {k: v.to(self.device, non_blocking=True) for k, v in batch.items()}
+                with torch.autocast(device_type=self.device.type, dtype=torch.bfloat16):
+                    total_loss += self.model(**batch).loss.item()
+                n += 1
+        avg = torch.tensor(total_loss / max(n, 1), device=self.device)
+        dist.all_reduce(avg, op=dist.ReduceOp.AVG)
+        self.model.train()
+        return avg.item()
+
+
+TRAINERS = {"sync": SyncingTrainer, "on-device": Trainer}
+
+
+## Worker -----------------------------
+def worker(rank: int, world_size: int, args, results):
+    dataset = SyntheticTokenDataset(synthetic_lengths(args.examples, args.max_seq_len))
+
+    for name, trainer_cls in TRAINERS.items():
+        model = tiny_llama(max_seq_len=args.max_seq_len)
+        with quiet_trainer(model, dataset, dataset, args.batch_size, trainer_cls=trainer_cls,
+                           logging_steps=args.logging_steps) as trainer:
+            t0 = time.perf_counter()
+            trainer._run_epoch(0)           # train + one eval
+            epoch_s = time.perf_counter() - t0
+            t0 = time.perf_counter()
+            eval_loss = trainer._run_eval()
+            eval_s = time.perf_counter() - t0
+        if rank == 0:
+            results.put((name, (epoch_s - eval_s) / len(trainer.train_data), eval_s, eval_loss))
+
+
+## Main -----------------------------
+def main(args):
+    results = result_queue()
+    spawn(worker, args.world_size, args, results)
+    print(f"world_size={args.world_size} backend={'nccl' if torch.cuda.is_available() else 'gloo'} "
+          f"logging_steps={args.logging_steps}")
+    print(f"{'mode':>10} {'step ms':>9} {'eval s':>8} {'eval loss':>10}")
+    while not results.empty():
+        name, step_s, eval_s, eval_loss = results.get()
+        print(f"{name:>10} {step_s * 1e3:>9.1f} {eval_s:>8.2f} {eval_loss:>10.4f}", flush=True)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Per-step host syncs vs on-device loss accumulation")
+    parser.add_argument("--world_size",    default=WORLD_SIZE,    type=int, help="Processes (gloo on CPU)")
+    parser.add_argument("--examples",      default=EXAMPLES,      type=int, help="Synthetic examples")
+    parser.add_argument("--batch_size",    default=BATCH_SIZE,    type=int, help="Per-rank batch size")
+    parser.add_argument("--max_seq_len",   default=MAX_SEQ_LEN,   type=int, help="Longest synthetic example")
+    parser.add_argument("--logging_steps", default=LOGGING_STEPS, type=int, help="Log (and, before, sync) every N steps")
+    args = parser.parse_args()
+
+    main(args)
@@ -0,0 +1,92 @@
+"""
+Per-rank memory of DDP vs FSDP (--fsdp) on CPU with the gloo backend (or on
+GPUs with NCCL when available), training a randomly initialized Llama with the
+Trainer for a few steps in each mode.
+
+Reports, per mode:
+  state GB   parameters + gradients + AdamW moments held by one rank, measured
+             on the live tensors at the first optimizer step
+  peak GB    growth of the rank's peak memory over the run: max allocated on
+             GPU; on CPU max RSS, which also counts the full model built
+             before sharding, FSDP's all-gather buffers and memory the
+             allocator keeps, so there only state GB is a clean comparison
+  step ms    time per optimizer step
+  eval loss  after the run: both modes train the same model on the same
+             batches, so the losses should agree
+
+Each mode runs in fresh processes, so peak memory is not carried over.
+
+Usage:
+    python bench_sharding.py
+    python bench_sharding.py --world_size 4 --hidden_size 1024 --num_layers 8
+"""
+
+import argparse
+import time
+
+import torch
+import torch.distributed as dist
+
+from bench_common import PatternTokenDataset, quiet_trainer, result_queue, spawn, synthetic_lengths, tiny_llama
+from metrics import peak_memory_gb
+from sharding import shard_model
+
+## Config -----------------------------
+WORLD_SIZE  = 2
+EXAMPLES    = 64
+BATCH_SIZE  = 2
+MAX_SEQ_LEN = 256
+HIDDEN_SIZE = 512
+NUM_LAYERS  = 8
+MODES       = ("ddp", "fsdp")
+
+
+## Worker -----------------------------
+def worker(rank: int, world_size: int, mode: str, args, results):
+    peak_start = peak_memory_gb()
+    dataset = PatternTokenDataset(synthetic_lengths(args.examples, args.max_seq_len))
+
+    model = tiny_llama(args.hidden_size, args.num_layers, max_seq_len=args.max_seq_len)
+    if mode == "fsdp":
+        model = shard_model(model)
+    with quiet_trainer(model, dataset, dataset, args.batch_size, lr=1e-3, fsdp=mode == "fsdp") as trainer:
+        t0 = time.perf_counter()
+        trainer._run_epoch(0)
+        epoch_s = time.perf_counter() - t0
+        t0 = time.perf_counter()
+        eval_loss = trainer._run_eval()
+        eval_s = time.perf_counter() - t0
+
+    state = trainer.state_memory
+    peak = torch.tensor(peak_memory_gb() - peak_start)
+    dist.all_reduce(peak, op=dist.ReduceOp.MAX)
+    if rank == 0:
+        results.put((mode, state["params"] + state["grads"] + state["optimizer"], peak.item(),
+                     (epoch_s - eval_s) / trainer.global_step, eval_loss))
+
+
+## Main -----------------------------
+def main(args):
+    results = result_queue()
+    for mode in MODES:
+        spawn(worker, args.world_size, mode, args, results)
+    n_params = sum(p.numel() for p in tiny_llama(args.hidden_size, args.num_layers).parameters())
+    print(f"world_size={args.world_size} backend={'nccl' if torch.cuda.is_available() else 'gloo'} "
+          f"params={n_params / 1e6:.1f}M")
+    print(f"{'mode':>6} {'state GB':>9} {'peak GB':>8} {'step ms':>8} {'eval loss':>10}")
+    while not results.empty():
+        mode, state_gb, peak_gb, step_s, eval_loss = results.get()
+        print(f"{mode:>6} {state_gb:>9.3f} {peak_gb:>8.3f} {step_s * 1e3:>8.1f} {eval_loss:>10.4f}", flush=True)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Per-rank memory: DDP vs FSDP")
+    parser.add_argument("--world_size",  default=WORLD_SIZE,  type=int, help="Processes (gloo on CPU)")
+    parser.add_argument("--examples",    default=EXAMPLES,    type=int, help="Synthetic examples")
+    parser.add_argument("--batch_size",  default=BATCH_SIZE,  type=int, help="Per-rank batch size")
+    parser.add_argument("--max_seq_len", default=MAX_SEQ_LEN, type=int, help="Longest synthetic example")
+    parser.add_argument("--hidden_size", default=HIDDEN_SIZE, type=int, help="Model width")
+    parser.add_argument("--num_layers",  default=NUM_LAYERS,  type=int, help="Model depth")
+    args = parser.parse_args()
+
+    main(args)
@@ -0,0 +1,158 @@
+"""
+CPU micro-benchmark of the DDP training loop, for catching regressions
+without a GPU cluster: the real Trainer, launched with torchrun over gloo,
+training a tiny randomly initialized Llama on synthetic data (no model or
+dataset paths needed).
+
+For every (world size, batch size, grad accum) in the matrix, one torchrun
+job runs two metrics windows of --steps optimizer steps each; the first is
+warm-up, the second is reported:
+
+  steps/s    optimizer steps per second
+  tokens/s   loss-bearing tokens per second, all ranks
+  peak RSS   max resident memory over the ranks (GB)
+
+--output appends the rows as JSONL (with the configuration) so runs can be
+diffed. Without --output the table is only printed.
+
+Usage:
+    python bench_trainer.py
+    python bench_trainer.py --world_sizes 1,2,4 --batch_sizes 2,8 --grad_accum 1,4 --output bench.jsonl
+    python bench_trainer.py --trainer_args="--fsdp"      # worker options: --fsdp, --comm_hook NAME
+"""
+
+import argparse
+import contextlib
+import io
+import itertools
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+## Config -----------------------------
+WORLD_SIZES = "1,2"
+BATCH_SIZES = "2,4"
+GRAD_ACCUM  = "1,2"
+STEPS       = 10
+MAX_SEQ_LEN = 256
+HIDDEN_SIZE = 128
+NUM_LAYERS  = 2
+
+
+## Worker (one torchrun job) -----------------------------
+def worker(args):
+    import torch
+    import torch.distributed as dist
+    from torch.optim.lr_scheduler import LambdaLR
+
+    from bench_common import SyntheticTokenDataset, pad_collate, synthetic_lengths, tiny_llama
+    from fine_tuning_ddp import Trainer, ddp_setup, prepare_dataloader, prepare_eval_dataloader
+    from sharding import shard_model
+
+    ddp_setup()
+    world_size, rank = dist.get_world_size(), dist.get_rank()
+    micro_batches = 2 * args.steps * args.grad_accum_steps   # per rank: warm-up window + measured window
+    train_set = SyntheticTokenDataset(synthetic_lengths(micro_batches * args.batch_size * world_size, args.max_seq_len))
+    eval_set  = SyntheticTokenDataset(synthetic_lengths(args.batch_size * world_size, args.max_seq_len, seed=1))
+
+    model = tiny_llama(args.hidden_size, args.num_layers, max_seq_len=args.max_seq_len)
+    if args.fsdp:
+        model = shard_model(model)
+    optimizer = torch.optim.AdamW(model.parameters(), lr=1e-4)
+    scheduler = LambdaLR(optimizer, lambda step: 1.0)
+    train_data = prepare_dataloader(train_set, args.batch_size, pad_collate, shuffle=True)
+    eval_data  = prepare_eval_dataloader(eval_set, args.batch_size, pad_collate)
+
+    with tempfile.TemporaryDirectory() as tmp, contextlib.redirect_stdout(io.StringIO()):
+        metrics_file = os.path.join(tmp, "metrics.jsonl")
+        trainer = Trainer(model, train_data, eval_data, optimizer, scheduler, save_every=1,
+                          snapshot_path=os.path.join(tmp, "snapshots"), grad_accum_steps=args.grad_accum_steps,
+                          metrics_file=metrics_file if rank == 0 else None, comm_hook=args.comm_hook, fsdp=args.fsdp,
+                          logging_steps=args.steps)
+        trainer._run_epoch(0)
+        if rank == 0:
+            with open(metrics_file) as fh:
+                window = [json.loads(line) for line in fh][-1]   # the measured (second) window
+
+    if rank == 0:
+        row = {
+            "world_size":       world_size,
+            "batch_size":       args.batch_size,
+            "grad_accum_steps": args.grad_accum_steps,
+            "steps_per_s":      args.steps / window["window_s"],
+            "tokens_per_s":     window["tokens_per_s"],
+            "peak_rss_gb":      window["peak_mem_gb"],
+            "allreduce_s":      window["allreduce_s"],
+            "data_wait_s":      window["data_wait_s"],
+            "data_stall_ms":    window["data_stall_ms_per_step"],
+        }
+        with open(args.result_file, "w") as fh:
+            json.dump(row, fh)
+    dist.destroy_process_group()
+
+
+## Launcher -----------------------------
+def run_matrix(args):
+    rows = []
+    print(f"{'world':>5} {'batch':>5} {'accum':>5} {'steps/s':>8} {'tokens/s':>9} {'peak RSS GB':>12}", flush=True)
+    for world_size, batch_size, grad_accum in itertools.product(
+        *(map(int, s.split(",")) for s in (args.world_sizes, args.batch_sizes, args.grad_accum))
+    ):
+        with tempfile.NamedTemporaryFile(suffix=".json") as result:
+            cmd = [
+                sys.executable, "-m", "torch.distributed.run", "--standalone", f"--nproc_per_node={world_size}",
+                os.path.abspath(__file__), "--worker", "--result_file", result.name,
+                "--batch_size", str(batch_size), "--grad_accum_steps", str(grad_accum), "--steps", str(args.steps),
+                "--max_seq_len", str(args.max_seq_len), "--hidden_size", str(args.hidden_size),
+                "--num_layers", str(args.num_layers), *args.trainer_args.split(),
+            ]
+            # One intra-op thread per rank unless set: otherwise the ranks oversubscribe the cores
+            env = {**os.environ, "OMP_NUM_THREADS": os.environ.get("OMP_NUM_THREADS", "1")}
+            t0 = time.perf_counter()
+            proc = subprocess.run(cmd, env=env, cwd=os.path.dirname(os.path.abspath(__file__)),
+                                  stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, text=True)
+            if proc.returncode != 0:
+                print(proc.stderr[-2000:], file=sys.stderr)
+                raise SystemExit(f"benchmark job failed: world_size={world_size} batch_size={batch_size} "
+                                 f"grad_accum_steps={grad_accum}")
+            with open(result.name) as fh:
+                row = json.load(fh)
+        row.update(job_s=time.perf_counter() - t0, steps=args.steps, max_seq_len=args.max_seq_len,
+                   hidden_size=args.hidden_size, num_layers=args.num_layers, trainer_args=args.trainer_args,
+                   time=time.time())
+        rows.append(row)
+        print(f"{world_size:>5} {batch_size:>5} {grad_accum:>5} {row['steps_per_s']:>8.2f} "
+              f"{row['tokens_per_s']:>9,.0f} {row['peak_rss_gb']:>12.2f}", flush=True)
+
+    if args.output:
+        with open(args.output, "a") as fh:
+            fh.writelines(json.dumps(row) + "\n" for row in rows)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="CPU benchmark matrix for the DDP Trainer (torchrun + gloo)")
+    parser.add_argument("--world_sizes", default=WORLD_SIZES, help="Comma-separated torchrun process counts")
+    parser.add_argument("--batch_sizes", default=BATCH_SIZES, help="Comma-separated per-rank batch sizes")
+    parser.add_argument("--grad_accum",  default=GRAD_ACCUM,  help="Comma-separated grad accumulation steps")
+    parser.add_argument("--steps",       default=STEPS,       type=int, help="Optimizer steps per window (warm-up + measured)")
+    parser.add_argument("--max_seq_len", default=MAX_SEQ_LEN, type=int, help="Longest synthetic example")
+    parser.add_argument("--hidden_size", default=HIDDEN_SIZE, type=int, help="Model width")
+    parser.add_argument("--num_layers",  default=NUM_LAYERS,  type=int, help="Model depth")
+    parser.add_argument("--trainer_args", default="", help="Extra worker flags (use =), e.g. --trainer_args=\"--comm_hook bf16\"")
+    parser.add_argument("--output",      default=None,        help="Append result rows as JSONL")
+    # Worker side, set by the launcher
+    parser.add_argument("--worker", action="store_true", help=argparse.SUPPRESS)
+    parser.add_argument("--result_file", help=argparse.SUPPRESS)
+    parser.add_argument("--batch_size", type=int, help=argparse.SUPPRESS)
+    parser.add_argument("--grad_accum_steps", type=int, help=argparse.SUPPRESS)
+    parser.add_argument("--fsdp", action="store_true", help="(worker) FSDP instead of DDP")
+    parser.add_argument("--comm_hook", default="allreduce", help="(worker) DDP gradient comm hook")
+    args = parser.parse_args()
+
+    if args.worker:
+        worker(args)
+    else:
+        run_matrix(args)
@@ -0,0 +1,275 @@
+"""
+Asynchronous, optionally sharded training checkpoints.
+
+save() copies the model, optimizer and scheduler state into reusable pinned CPU
+buffers with non-blocking device-to-host copies, then hands the write to a
+background thread, so training resumes as soon as the copies are enqueued.
+Stream ordering keeps the snapshot consistent: the next optimizer.step() runs
+after the copies on the same stream.
+
+Every rank writes one shard file. With sharded=True, model tensors and
+optimizer state are split round-robin across ranks, so each rank writes 1/N
+of the bytes; otherwise rank 0 writes everything and the other shards only
+hold that rank's RNG state. Tensors that are already sharded (FSDP DTensors)
+are always written by every rank as its local dim-0 slice. Resuming FSDP at
+the saved world size, each rank takes its own slices as they are (shard
+files are memory-mapped, so other ranks' slices are never read); otherwise
+loading concatenates the slices and re-shards them for the current model, so
+a run can resume at a different world size or switch between DDP and FSDP.
+Files are written to a temp name, fsynced and renamed. Rank 0 commits the checkpoint once every shard is present, by
+writing manifest.json and then repointing `latest` (both via rename). A crash
+at any point leaves the previous checkpoint as `latest`.
+
+Layout:
+    <dir>/step_00001200/shard-00000-of-00004-<run_id>.pt
+    <dir>/step_00001200/manifest.json
+    <dir>/latest                        -> "step_00001200"
+"""
+
+import json
+import os
+import random
+import shutil
+import threading
+import time
+from collections import defaultdict
+
+import numpy as np
+import torch
+from torch.distributed.tensor import DTensor, distribute_tensor
+
+MANIFEST = "manifest.json"
+LATEST   = "latest"
+
+
+## Helpers -----------------------------
+def _atomic_write(path: str, write) -> None:
+    tmp = f"{path}.tmp"
+    with open(tmp, "wb") as fh:
+        write(fh)
+        fh.flush()
+        os.fsync(fh.fileno())
+    os.replace(tmp, path)
+
+
+def shard_name(rank: int, world_size: int, run_id: str) -> str:
+    # run_id keeps a shard left behind by a crashed earlier run from being committed with this one
+    return f"shard-{rank:05d}-of-{world_size:05d}-{run_id}.pt"
+
+
+def rng_state() -> dict:
+    state = {
+        "python": random.getstate(),
+        "numpy":  np.random.get_state(),
+        "torch":  torch.get_rng_state(),
+    }
+    if torch.cuda.is_available():
+        state["cuda"] = torch.cuda.get_rng_state()
+    return state
+
+
+def set_rng_state(state: dict) -> None:
+    random.setstate(state["python"])
+    np.random.set_state(state["numpy"])
+    torch.set_rng_state(state["torch"])
+    if "cuda" in state and torch.cuda.is_available():
+        torch.cuda.set_rng_state(state["cuda"])
+
+
+def latest_checkpoint(directory: str) -> str | None:
+    """Path of the last committed checkpoint under directory, or None."""
+    try:
+        with open(os.path.join(directory, LATEST)) as fh:
+            path = os.path.join(directory, fh.read().strip())
+    except FileNotFoundError:
+        return None
+    return path if os.path.exists(os.path.join(path, MANIFEST)) else None
+
+
+## Checkpointer -----------------------------
+class AsyncCheckpointer:
+    def __init__(self, directory: str, rank: int, world_size: int, run_id: str, sharded: bool = False,
+                 keep: int = 2, commit_timeout_s: float = 1800.0):
+        self.directory = directory
+        self.rank = rank
+        self.world_size = world_size
+        self.run_id = run_id
+        self.sharded = sharded
+        self.keep = keep
+        self.commit_timeout_s = commit_timeout_s
+        self._buffers: dict[str, torch.Tensor] = {}
+        self._thread: threading.Thread | None = None
+        self._error: BaseException | None = None
+        self.last_stall_s = 0.0
+        self.last_write_s = 0.0
+
+    def _owns(self, i: int) -> bool:
+        return i % self.world_size == self.rank if self.sharded else self.rank == 0
+
+    def _to_cpu(self, key: str, t: torch.Tensor) -> torch.Tensor:
+        """Non-blocking copy into a reusable (pinned, when CUDA is present) host buffer."""
+        buf = self._buffers.get(key)
+        if buf is None or buf.shape != t.shape or buf.dtype != t.dtype:
+            buf = self._buffers[key] = torch.empty(t.shape, dtype=t.dtype, device="cpu",
+                                                   pin_memory=t.is_cuda)
+        buf.copy_(t.detach(), non_blocking=True)
+        return buf
+
+    def _snapshot(self, model: torch.nn.Module, optimizer, scheduler, extra: dict) -> dict:
+        shard = {"RNG_STATE": rng_state()}
+
+        model_state = model.state_dict()
+        shard["MODEL_STATE"] = {
+            k: self._to_cpu(f"model.{k}", v) for i, (k, v) in enumerate(model_state.items())
+            if not isinstance(v, DTensor) and self._owns(i)
+        }
+        # FSDP: each rank holds a dim-0 slice of every sharded tensor and writes exactly that
+        shard["MODEL_SLICES"] = {
+            k: self._to_cpu(f"model.{k}", v.to_local()) for k, v in model_state.items() if isinstance(v, DTensor)
+        }
+
+        optim_state = optimizer.state_dict()
+        shard["OPTIMIZER_STATE"], shard["OPTIMIZER_SLICES"] = {}, {}
+        for pid, s in optim_state["state"].items():
+            if self._owns(pid):
+                shard["OPTIMIZER_STATE"][pid] = {
+                    k: self._to_cpu(f"optim.{pid}.{k}", v) if torch.is_tensor(v) else v
+                    for k, v in s.items() if not isinstance(v, DTensor)
+                }
+            slices = {k: self._to_cpu(f"optim.{pid}.{k}", v.to_local()) for k, v in s.items() if isinstance(v, DTensor)}
+            if slices:
+                shard["OPTIMIZER_SLICES"][pid] = slices
+        if self.rank == 0:
+            shard["OPTIMIZER_PARAM_GROUPS"] = optim_state["param_groups"]
+            shard["SCHEDULER_STATE"] = scheduler.state_dict()
+            shard["EXTRA"] = extra
+        return shard
+
+    def save(self, name: str, model: torch.nn.Module, optimizer, scheduler, extra: dict) -> None:
+        """Snapshot state to host memory and write it in the background. All ranks must call this."""
+        self.wait()   # one checkpoint in flight at a time; keeps the host buffers free to reuse
+        t0 = time.perf_counter()
+        shard = self._snapshot(model, optimizer, scheduler, extra)
+        event = None
+        if torch.cuda.is_available():
+            event = torch.cuda.Event()
+            event.record()
+        self.last_stall_s = time.perf_counter() - t0
+
+        path = os.path.join(self.directory, name)
+        self._thread = threading.Thread(target=self._write, args=(path, shard, event, extra), daemon=True)
+        self._thread.start()
+
+    def _write(self, path: str, shard: dict, event, extra: dict) -> None:
+        try:
+            t0 = time.perf_counter()
+            if event is not None:
+                event.synchronize()   # the device-to-host copies have landed
+            os.makedirs(path, exist_ok=True)
+            _atomic_write(os.path.join(path, shard_name(self.rank, self.world_size, self.run_id)),
+                          lambda fh: torch.save(shard, fh))
+            if self.rank == 0:
+                self._commit(path, extra)
+            self.last_write_s = time.perf_counter() - t0
+        except BaseException as exc:
+            self._error = exc
+
+    def _commit(self, path: str, extra: dict) -> None:
+        """Rank 0: wait for every shard file, then publish the manifest and move `latest`."""
+        shards = [shard_name(r, self.world_size, self.run_id) for r in range(self.world_size)]
+        deadline = time.monotonic() + self.commit_timeout_s
+        while not all(os.path.exists(os.path.join(path, s)) for s in shards):
+            if time.monotonic() > deadline:
+                raise TimeoutError(f"checkpoint {path}: not all shards were written")
+            time.sleep(0.5)
+
+        manifest = {"world_size": self.world_size, "sharded": self.sharded, "shards": shards,
+                    **{k: v for k, v in extra.items() if isinstance(v, (int, float, str))}}
+        _atomic_write(os.path.join(path, MANIFEST), lambda fh: fh.write(json.dumps(manifest, indent=2).encode()))
+        _atomic_write(os.path.join(self.directory, LATEST), lambda fh: fh.write(os.path.basename(path).encode()))
+        self._prune()
+
+    def _prune(self) -> None:
+        committed = sorted(
+            d for d in os.listdir(self.directory)
+            if os.path.exists(os.path.join(self.directory, d, MANIFEST))
+        )
+        for old in committed[:-self.keep]:
+            shutil.rmtree(os.path.join(self.directory, old), ignore_errors=True)
+
+    def wait(self) -> None:
+        """Block until the in-flight write (if any) is done; re-raise its error."""
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        if self._error is not None:
+            error, self._error = self._error, None
+            raise RuntimeError("background checkpoint write failed") from error
+
+
+## Loading -----------------------------
+def _place_like(value: torch.Tensor, like: torch.Tensor) -> torch.Tensor:
+    """Full tensor -> this rank's shard when the live counterpart is an FSDP DTensor."""
+    if isinstance(like, DTensor) and not isinstance(value, DTensor):
+        return distribute_tensor(value.to(like.device), like.device_mesh, like.placements)
+    return value
+
+
+def _from_slices(slices: list[torch.Tensor], like, rank: int, same_world: bool) -> torch.Tensor:
+    """
+    A saved FSDP tensor (dim-0 slices in rank order) for its live counterpart: this rank's own slice
+    as a DTensor when the layout is unchanged, else the merged full tensor, for _place_like to re-shard.
+    """
+    if same_world and isinstance(like, DTensor) and slices[rank].shape == like.to_local().shape:
+        return DTensor.from_local(slices[rank].to(like.device), like.device_mesh, like.placements,
+                                  shape=like.shape, stride=like.stride())
+    return torch.cat(slices)
+
+
+def load_model_state(model: torch.nn.Module, state: dict) -> None:
+    """load_state_dict for full (unsharded) tensors, into a plain or an FSDP-sharded model."""
+    live = model.state_dict()
+    model.load_state_dict({k: _place_like(v, live[k]) if k in live else v for k, v in state.items()})
+
+
+def load_checkpoint(path: str, rank: int, world_size: int, model: torch.nn.Module, optimizer, scheduler) -> dict:
+    """
+    Load a committed checkpoint into model/optimizer/scheduler; returns the saved extras. FSDP slices
+    are only merged into full tensors when resharding (another world size, or DDP <-> FSDP).
+    """
+    with open(os.path.join(path, MANIFEST)) as fh:
+        manifest = json.load(fh)
+    same_world = manifest["world_size"] == world_size
+    model_state, optim_state, meta = {}, {}, {}
+    model_slices, optim_slices = defaultdict(list), defaultdict(list)   # in rank order
+    for r, name in enumerate(manifest["shards"]):
+        # mmap: tensors are only read when used, so other ranks' slices stay on disk unless merged
+        shard = torch.load(os.path.join(path, name), map_location="cpu", weights_only=False, mmap=True)
+        model_state.update(shard["MODEL_STATE"])
+        for k, v in shard.get("MODEL_SLICES", {}).items():
+            model_slices[k].append(v)
+        for pid, s in shard["OPTIMIZER_STATE"].items():
+            optim_state.setdefault(pid, {}).update(s)
+        for pid, s in shard.get("OPTIMIZER_SLICES", {}).items():
+            for k, v in s.items():
+                optim_slices[pid, k].append(v)
+        if r == 0:
+            meta = shard
+        if r == rank and same_world:
+            set_rng_state(shard["RNG_STATE"])
+    # Optimizer state ids follow the order of the parameters across param groups
+    params = [p for group in optimizer.param_groups for p in group["params"]]
+    live = model.state_dict()
+    model_state.update({k: _from_slices(v, live.get(k), rank, same_world) for k, v in model_slices.items()})
+    for (pid, k), v in optim_slices.items():
+        optim_state.setdefault(pid, {})[k] = _from_slices(v, params[pid], rank, same_world)
+
+    load_model_state(model, model_state)
+    optim_state = {
+        pid: {k: _place_like(v, params[pid]) if torch.is_tensor(v) and v.shape == params[pid].shape else v
+              for k, v in s.items()}
+        for pid, s in optim_state.items()
+    }
+    optimizer.load_state_dict({"state": optim_state, "param_groups": meta["OPTIMIZER_PARAM_GROUPS"]})
+    scheduler.load_state_dict(meta["SCHEDULER_STATE"])
+    return meta["EXTRA"]
@@ -0,0 +1,73 @@
+"""
+Compiled execution mode (--compile) for the Trainer.
+
+compile_model() compiles in place with nn.Module.compile(), so parameter
+names, state dicts and checkpoints are unchanged. Under DDP the wrapper
+itself is compiled, so dynamo's DDPOptimizer splits the graph at gradient
+bucket boundaries and the all-reduces still overlap the backward pass. Under
+FSDP2 every transformer block is compiled on its own, and the FSDP hooks
+between blocks stay in eager mode. Shapes vary with dynamic padding; after
+the first recompile, dynamo marks the sequence dimension dynamic.
+
+Compiled kernels (Inductor's FX graph and AOTAutograd caches) are written to
+COMPILE_CACHE_DIR. With that on a shared filesystem, a restarted job only
+re-traces: codegen and kernel compilation come from the cache. The same
+holds for the other ranks and nodes. compile_report() summarizes graphs and
+graph breaks (with their reasons) from dynamo's counters.
+
+adamw() builds the optimizer with the chosen implementation: the default
+for-loop/foreach one, foreach (one multi-tensor kernel per op), or fused
+(one kernel for the whole update, on CUDA or CPU).
+"""
+
+import os
+
+import torch
+import torch._functorch.config
+import torch._inductor.config
+
+from sharding import transformer_blocks
+
+COMPILE_CACHE_DIR = os.environ.get("TORCHINDUCTOR_CACHE_DIR", "compile_cache")   # set per cluster in the config ([ddp])
+ADAMW_IMPLS = ("default", "foreach", "fused")
+GRAPH_BREAK_REASONS = 5   # most frequent reasons listed in the report
+
+
+## Compilation -----------------------------
+def enable_compile_cache(cache_dir: str = COMPILE_CACHE_DIR) -> None:
+    """Persist compiled artifacts in cache_dir. Call before the first compilation."""
+    os.makedirs(cache_dir, exist_ok=True)
+    os.environ["TORCHINDUCTOR_CACHE_DIR"] = cache_dir
+    torch._inductor.config.fx_graph_cache = True
+    torch._functorch.config.enable_autograd_cache = True
+
+
+def compile_model(model: torch.nn.Module, fsdp: bool = False) -> None:
+    """Compile in place: the DDP-wrapped model, or each transformer block of an FSDP model."""
+    # Training needs no KV cache; its per-layer state would add guards (and a recompile per block)
+    getattr(model, "module", model).config.use_cache = False
+    for module in (transformer_blocks(model) if fsdp else [model]):
+        module.compile()
+
+
+def _break_reason(reason: str) -> str:
+    """The explanation line of a graph-break message (naming the function), else its first line."""
+    lines = [line.strip() for line in reason.splitlines()]
+    return next((line.removeprefix("Explanation: ") for line in lines if line.startswith("Explanation:")), lines[0])[:160]
+
+
+def compile_report() -> str:
+    """Graphs and graph breaks so far; the DDP wrapper's own forward accounts for a few breaks."""
+    from torch._dynamo.utils import counters
+    breaks = counters["graph_break"]
+    reasons = "; ".join(f"{n}x {_break_reason(r)}" for r, n in breaks.most_common(GRAPH_BREAK_REASONS))
+    return (f"torch.compile | {counters['stats']['unique_graphs']} graphs, {sum(breaks.values())} graph breaks"
+            + (f": {reasons}" if reasons else ""))
+
+
+## Optimizer -----------------------------
+def adamw(params, lr: float, impl: str = "default") -> torch.optim.AdamW:
+    if impl not in ADAMW_IMPLS:
+        raise ValueError(f"unknown AdamW implementation {impl!r}, expected one of {ADAMW_IMPLS}")
+    options = {"default": {}, "foreach": {"foreach": True}, "fused": {"fused": True}}[impl]
+    return torch.optim.AdamW(params, lr=lr, **options)
@@ -0,0 +1,121 @@
+"""
+Typed run configuration shared by fine_tuning_ddp.py (raw DDP/FSDP) and
+fine_tuning_ddp_accelerate.py (accelerate + SFTTrainer).
+
+One TOML file (or YAML, with PyYAML installed) holds the paths and settings
+that used to be hard-coded in the scripts:
+
+  [data]    dataset, model, token cache, chat template and split: both backends
+            read exactly the same token ids, train/eval split and eval subset
+  [train]   hyper-parameters both backends understand
+  [ddp]     any other fine_tuning_ddp.py option, by its flag name (fsdp = true)
+
+Values are checked against the field types on load, and unknown sections or
+keys are errors, so a typo fails before the job is queued rather than after.
+$VARS in paths are expanded. Command-line flags override the file.
+
+Usage:
+    torchrun ... fine_tuning_ddp.py --config configs/leonardo.toml
+    accelerate launch fine_tuning_ddp_accelerate.py --config configs/leonardo.toml
+"""
+
+import dataclasses
+import os
+import tomllib
+from dataclasses import dataclass, field
+
+DEFAULT_CONFIG = os.path.join(os.path.dirname(os.path.abspath(__file__)), "configs", "leonardo.toml")
+
+
+## Sections -----------------------------
+@dataclass
+class DataConfig:
+    dataset_path: str                # raw dataset (datasets.save_to_disk)
+    model_id: str                    # model weights, tokenizer and chat template
+    token_cache_dir: str             # pre-tokenized dataset, on a filesystem shared by all nodes
+    model_cache_dir: str = ""        # bf16 snapshots of model_id + tokenizer, shared too ("": load model_id directly)
+    system_prompt: str = "You are a helpful and courteous customer support assistant."
+    max_seq_len: int = 1024
+    num_proc: int = 0                # tokenization processes (0: this job's cores, up to 16)
+    test_size: float = 0.1
+    split_seed: int = 42
+    eval_samples: int = 0            # fixed eval subset (0: the whole split)
+
+
+@dataclass
+class TrainConfig:
+    total_epochs: int = 1
+    save_every: int = 1              # epochs between snapshots
+    batch_size: int = 2              # per GPU
+    grad_accum_steps: int = 4
+    learning_rate: float = 2e-5
+    warmup_ratio: float = 0.03       # linear warmup, then cosine decay
+    logging_steps: int = 25
+    output_dir: str = "snapshots"    # DDP snapshots / SFTTrainer output
+
+
+@dataclass
+class Config:
+    data: DataConfig
+    train: TrainConfig = field(default_factory=TrainConfig)
+    ddp: dict = field(default_factory=dict)
+
+
+## Loading -----------------------------
+def _section(cls, values: dict, name: str):
+    """Build a section dataclass from a mapping, checking keys and value types."""
+    fields = {f.name: f for f in dataclasses.fields(cls)}
+    unknown = sorted(set(values) - set(fields))
+    if unknown:
+        raise ValueError(f"[{name}]: unknown keys {unknown}, expected some of {sorted(fields)}")
+    missing = sorted(n for n, f in fields.items()
+                     if f.default is dataclasses.MISSING and f.default_factory is dataclasses.MISSING and n not in values)
+    if missing:
+        raise ValueError(f"[{name}]: missing required keys {missing}")
+    typed = {}
+    for key, value in values.items():
+        expected = fields[key].type
+        if expected is float and type(value) is int:
+            value = float(value)
+        if type(value) is not expected:
+            raise TypeError(f"[{name}] {key}: expected {expected.__name__}, got {type(value).__name__} ({value!r})")
+        typed[key] = os.path.expandvars(value) if expected is str else value
+    return cls(**typed)
+
+
+def load_config(path: str = DEFAULT_CONFIG) -> Config:
+    if path.endswith((".yaml", ".yml")):
+        try:
+            import yaml
+        except ImportError as e:
+            raise ImportError("YAML configs need PyYAML (pip install pyyaml); TOML needs nothing extra") from e
+        with open(path) as fh:
+            raw = yaml.safe_load(fh) or {}
+    else:
+        with open(path, "rb") as fh:
+            raw = tomllib.load(fh)
+    unknown = sorted(set(raw) - {"data", "train", "ddp"})
+    if unknown:
+        raise ValueError(f"{path}: unknown sections {unknown}, expected [data], [train] and [ddp]")
+    return Config(
+        data=_section(DataConfig, raw.get("data", {}), "data"),
+        train=_section(TrainConfig, raw.get("train", {}), "train"),
+        ddp=dict(raw.get("ddp", {})),
+    )
+
+
+def parser_defaults(parser, options: dict, section: str = "ddp") -> dict:
+    """Check `options` against an argparse parser's flags (names and types); returns them as parser defaults."""
+    actions = {a.dest: a for a in parser._actions}
+    for key, value in options.items():
+        action = actions.get(key)
+        if action is None or key == "help":
+            raise ValueError(f"[{section}] {key}: not an option of {parser.prog}")
+        expected = bool if action.nargs == 0 else (action.type or str)
+        if expected is float and type(value) is int:
+            options[key] = value = float(value)
+        if type(value) is not expected:
+            raise TypeError(f"[{section}] {key}: expected {expected.__name__}, got {type(value).__name__} ({value!r})")
+        if action.choices is not None and value not in action.choices:
+            raise ValueError(f"[{section}] {key}: {value!r} is not one of {list(action.choices)}")
+    return options
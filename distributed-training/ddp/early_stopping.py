@@ -0,0 +1,35 @@
+"""
+Early stopping on the eval loss.
+
+The Trainer calls update() after every evaluation. The eval loss is
+all-reduced, so every rank sees the same value and reaches the same decision
+without communicating. The counters go into snapshots, so a resumed run keeps
+its patience.
+"""
+
+import math
+
+
+class EarlyStopping:
+    """Stop after `patience` evaluations in a row without improving the best loss by more than min_delta."""
+    def __init__(self, patience: int, min_delta: float = 0.0):
+        self.patience = patience
+        self.min_delta = min_delta
+        self.best = math.inf
+        self.bad_evals = 0
+
+    def update(self, eval_loss: float) -> bool:
+        """Record an eval loss; True when training should stop."""
+        if eval_loss < self.best - self.min_delta:
+            self.best = eval_loss
+            self.bad_evals = 0
+        else:
+            self.bad_evals += 1
+        return self.bad_evals >= self.patience
+
+    def state_dict(self) -> dict:
+        return {"best": self.best, "bad_evals": self.bad_evals}
+
+    def load_state_dict(self, state: dict) -> None:
+        self.best = state["best"]
+        self.bad_evals = state["bad_evals"]
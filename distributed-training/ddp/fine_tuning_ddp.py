@@ -1,19 +1,29 @@
 import os
 import math
+import dataclasses
 import time
+import uuid
 import torch
 import torch.distributed as dist
 from torch.utils.data import DataLoader
-from torch.utils.data.distributed import DistributedSampler
 from torch.nn.parallel import DistributedDataParallel as DDP
 from torch.distributed import init_process_group, destroy_process_group
 from torch.optim.lr_scheduler import LambdaLR
 
-from transformers import AutoModelForCausalLM, AutoTokenizer, DataCollatorForLanguageModeling
-from datasets import load_from_disk
+from transformers import DataCollatorForLanguageModeling
 
-WARMUP_RATIO  = 0.03
-LOGGING_STEPS = 25
+from activation_checkpointing import apply_memory_plan, checkpoint_blocks, default_budget_gb
+from packing import IGNORE_INDEX, PackedCollator, PackedDataset
+from samplers import LengthBucketBatchSampler, ResumableDistributedSampler, ShardedEvalSampler
+from checkpointing import AsyncCheckpointer, latest_checkpoint, load_checkpoint, load_model_state
+from early_stopping import EarlyStopping
+from compilation import ADAMW_IMPLS, COMPILE_CACHE_DIR, adamw, compile_model, compile_report, enable_compile_cache
+from comm_hooks import BUCKET_CAP_MB, COMM_HOOKS, POWERSGD_RANK, make_comm_hook
+from metrics import PEAK_TFLOPS, CommTimer, TrainMetrics, batch_counts
+from sharding import format_memory_report, shard_model, state_memory_gb, transformer_blocks
+from prefetch import PREFETCH_DEPTH, DevicePrefetcher, autotune_loader
+from preprocess import NUM_PROC, load_model, prepare_splits
+from config import DEFAULT_CONFIG, DataConfig, TrainConfig, load_config, parser_defaults
 
 
 ## DDP setup -----------------------------
@@ -22,8 +32,15 @@ def ddp_setup():
     torchrun sets LOCAL_RANK, RANK, WORLD_SIZE, MASTER_ADDR, MASTER_PORT.
     Works identically for single-node and multi-node launches.
     """
-    torch.cuda.set_device(int(os.environ["LOCAL_RANK"]))
-    init_process_group(backend="nccl")
+    if torch.cuda.is_available():
+        torch.cuda.set_device(int(os.environ["LOCAL_RANK"]))
+        init_process_group(backend="nccl")
+    else:
+        init_process_group(backend="gloo")   # CPU runs (benchmarks, tests)
+
+
+def local_device() -> torch.device:
+    return torch.device("cuda", int(os.environ["LOCAL_RANK"])) if torch.cuda.is_available() else torch.device("cpu")
 
 
 ## Trainer class -----------------------------
@@ -38,10 +55,27 @@ class Trainer:
         save_every: int,
         snapshot_path: str,
         grad_accum_steps: int = 1,
+        sharded_checkpoints: bool = False,
+        save_every_steps: int = 0,
+        metrics_file: str | None = None,
+        peak_tflops: float = PEAK_TFLOPS,
+        comm_hook: str = "allreduce",
+        bucket_cap_mb: float = BUCKET_CAP_MB,
+        powersgd_rank: int = POWERSGD_RANK,
+        fsdp: bool = False,
+        prefetch_depth: int = PREFETCH_DEPTH,
+        eval_every_steps: int = 0,
+        early_stopping: EarlyStopping | None = None,
+        compiled: bool = False,
+        logging_steps: int = TrainConfig.logging_steps,
     ) -> None:
         self.local_rank  = int(os.environ["LOCAL_RANK"])
         self.global_rank = int(os.environ["RANK"])
-        self.model = model.to(self.local_rank)
+        self.device = local_device()
+        # fsdp: the model arrives already sharded (shard_model) and on the device
+        self.fsdp = fsdp
+        self.model = model if fsdp else model.to(self.device)
+        self.module = model   # the unwrapped model, for checkpoints and metrics
         self.train_data = train_data
         self.eval_data  = eval_data
         self.optimizer  = optimizer
@@ -49,185 +83,337 @@ class Trainer:
         self.save_every = save_every
         self.snapshot_path = snapshot_path
         self.grad_accum_steps = grad_accum_steps
+        self.save_every_steps = save_every_steps
+        self.prefetch_depth = prefetch_depth   # batches copied to the device ahead of the current one
+        self.eval_every_steps = eval_every_steps   # 0: eval at epoch end only
+        self.early_stopping = early_stopping
+        self.last_eval_step = -1
+        self.stop = False
+        self.compiled = compiled
+        self.logging_steps = logging_steps   # optimizer steps per metrics window
         self.epochs_run  = 0
         self.global_step = 0
+        self.resume_micro_step = 0   # micro-batches of epochs_run already consumed
+        self.epoch = 0
+        self.state_memory = None     # per-rank params/grads/optimizer bytes, measured at the first step
+        # Training loss stays on device between log lines; read back once per logging_steps window
+        self.loss_sum   = torch.zeros((), device=self.device)
+        self.loss_steps = 0
+        run_id = [uuid.uuid4().hex[:8]]
+        dist.broadcast_object_list(run_id, src=0)   # same id on every rank names this run's shard files
+        self.checkpointer = AsyncCheckpointer(
+            snapshot_path, self.global_rank, dist.get_world_size(), run_id[0], sharded=sharded_checkpoints
+        )
 
-        if os.path.exists(snapshot_path):
+        if os.path.isfile(snapshot_path) or latest_checkpoint(snapshot_path):
             print(f"[GPU{self.global_rank}] Loading snapshot")
             self._load_snapshot(snapshot_path)
 
-        self.model = DDP(
-            self.model,
-            device_ids=[self.local_rank],
-            find_unused_parameters=False,
-            bucket_cap_mb=25,
-        )
+        if fsdp:
+            if comm_hook != "allreduce":
+                raise ValueError("comm hooks apply to DDP only; FSDP reduce-scatters gradients itself")
+            comm = None   # no comm hook to time: allreduce_s stays 0 in the metrics
+        else:
+            self.model = DDP(
+                self.model,
+                device_ids=[self.local_rank] if self.device.type == "cuda" else None,
+                find_unused_parameters=False,
+                bucket_cap_mb=bucket_cap_mb,
+            )
+            # The timer wraps the chosen comm hook and times each gradient bucket
+            comm = CommTimer(*make_comm_hook(comm_hook, powersgd_rank))
+            self.model.register_comm_hook(comm, CommTimer.ddp_hook)
+        if compiled:
+            # After wrapping: compiling DDP itself keeps the bucketed all-reduce overlap
+            compile_model(self.model, fsdp)
+        # Per-window throughput/MFU
+        self.metrics = TrainMetrics(self.module, self.global_rank, metrics_file, peak_tflops, comm)
 
     def _load_snapshot(self, snapshot_path):
-        loc = f"cuda:{self.local_rank}"
-        snapshot = torch.load(snapshot_path, map_location=loc)
-        self.model.load_state_dict(snapshot["MODEL_STATE"])
+        if os.path.isfile(snapshot_path):
+            # Legacy single-file snapshot: model weights and counters only
+            snapshot = torch.load(snapshot_path, map_location=self.device)
+            load_model_state(self.model, snapshot["MODEL_STATE"])
+        else:
+            snapshot = load_checkpoint(
+                latest_checkpoint(snapshot_path), self.global_rank, dist.get_world_size(),
+                self.model, self.optimizer, self.scheduler,
+            )
         self.epochs_run  = snapshot["EPOCHS_RUN"]
         self.global_step = snapshot.get("GLOBAL_STEP", 0)
-        print(f"Resuming training from snapshot at Epoch {self.epochs_run}")
+        self.resume_micro_step = snapshot.get("MICRO_STEP", 0)
+        if self.early_stopping is not None and "EARLY_STOPPING" in snapshot:
+            self.early_stopping.load_state_dict(snapshot["EARLY_STOPPING"])
+        print(f"Resuming training from snapshot at Epoch {self.epochs_run} "
+              f"| micro-batch {self.resume_micro_step}")
 
     def _run_batch(self, batch, micro_step):
         # Skip gradient AllReduce on accumulation steps — only sync on the
         # step that will actually call optimizer.step().
         is_accum = (micro_step + 1) % self.grad_accum_steps != 0
-        sync_ctx = self.model.no_sync() if is_accum else torch.enable_grad()
+        if self.fsdp:
+            self.model.set_requires_gradient_sync(not is_accum)   # FSDP's no_sync: skip the reduce-scatter
+            sync_ctx = torch.enable_grad()
+        else:
+            sync_ctx = self.model.no_sync() if is_accum else torch.enable_grad()
 
         with sync_ctx:
-            with torch.autocast(device_type="cuda", dtype=torch.bfloat16):
+            with torch.autocast(device_type=self.device.type, dtype=torch.bfloat16):
                 outputs = self.model(**batch)
                 loss = outputs.loss / self.grad_accum_steps
             loss.backward()
+        self.loss_sum += loss.detach()   # no .item(): stays queued on the device
 
         if not is_accum:
             self.optimizer.step()
+            if self.state_memory is None:
+                # AdamW allocates its moments on the first step; gradients are still live here
+                self.state_memory = state_memory_gb(self.module, self.optimizer)
+                if self.global_rank == 0:
+                    print(format_memory_report(self.state_memory), flush=True)
+                    if self.compiled:
+                        print(compile_report(), flush=True)
             self.scheduler.step()
             self.optimizer.zero_grad(set_to_none=True)
             self.global_step += 1
-
-            if self.global_step % LOGGING_STEPS == 0:
-                # Reduce loss across ranks so the log line shows the true average.
-                loss_t = torch.tensor(loss.item() * self.grad_accum_steps, device=self.local_rank)
-                dist.all_reduce(loss_t, op=dist.ReduceOp.AVG)
-                if self.global_rank == 0:
-                    print(
-                        f"step {self.global_step:>6} | loss {loss_t.item():.4f} "
-                        f"| lr {self.scheduler.get_last_lr()[0]:.2e}",
-                        flush=True,
-                    )
+            self.loss_steps += 1
+
+            # Step-level snapshot: only on optimizer-step boundaries, so no partial gradients are lost
+            if self.save_every_steps and self.global_step % self.save_every_steps == 0:
+                self._save_snapshot(self.epoch, micro_step + 1)
+
+            if self.global_step % self.logging_steps == 0:
+                # Mean loss over the window's optimizer steps, averaged across ranks inside the
+                # metrics all_gather: one device sync and one collective per log line
+                self.metrics.flush(
+                    self.global_step, self.epoch, self.scheduler.get_last_lr()[0],
+                    self.loss_sum / self.loss_steps, device=self.device, steps=self.loss_steps,
+                )
+                self.loss_sum.zero_()
+                self.loss_steps = 0
+
+            if self.eval_every_steps and self.global_step % self.eval_every_steps == 0:
+                self._evaluate()
+
+    def _evaluate(self) -> float:
+        """Eval, then the early-stopping check: the loss is all-reduced, so every rank decides the same."""
+        eval_loss = self._run_eval()
+        self.last_eval_step = self.global_step
+        note = ""
+        if self.early_stopping is not None:
+            self.stop = self.early_stopping.update(eval_loss)
+            note = (f" | best {self.early_stopping.best:.4f} "
+                    f"| {self.early_stopping.bad_evals}/{self.early_stopping.patience} evals without improvement"
+                    + (" | early stop" if self.stop else ""))
+        if self.global_rank == 0:
+            print(f"[GPU0] Epoch {self.epoch} | step {self.global_step} | eval loss {eval_loss:.4f}{note}", flush=True)
+        return eval_loss
 
     def _run_eval(self):
-        """All ranks participate (needed for dist.all_reduce); only rank 0 prints."""
+        """
+        All ranks participate (needed for dist.all_reduce); only rank 0 prints.
+        Token-weighted mean loss: each batch counts by its number of target tokens, so
+        batches with heavy padding do not skew it. Sums stay on the device until the end.
+        Ranks with fewer eval batches (ShardedEvalSampler does not pad) repeat their last
+        batch at zero weight, so FSDP's per-forward collectives stay in step.
+        """
         self.model.eval()
-        total_loss, n = 0.0, 0
+        totals = torch.zeros(2, dtype=torch.float64, device=self.device)   # [loss x tokens, tokens]
+        def target_tokens(batch):
+            # HF shifts labels by one inside the loss; counted on the host, before the copy
+            return int(batch["labels"][:, 1:].ne(IGNORE_INDEX).sum())
+
+        n_batches = torch.tensor(len(self.eval_data), device=self.device)
+        dist.all_reduce(n_batches, op=dist.ReduceOp.MAX)
+        batches = iter(DevicePrefetcher(self.eval_data, self.device, self.prefetch_depth, target_tokens))
+        batch = None
         with torch.no_grad():
-            for batch in self.eval_data:
-                batch = {k: v.to(self.local_rank, non_blocking=True) for k, v in batch.items()}
-                with torch.autocast(device_type="cuda", dtype=torch.bfloat16):
+            for _ in range(int(n_batches)):
+                n_tokens, batch = next(batches, (0, batch))
+                with torch.autocast(device_type=self.device.type, dtype=torch.bfloat16):
                     outputs = self.model(**batch)
-                total_loss += outputs.loss.item()
-                n += 1
-        avg = torch.tensor(total_loss / max(n, 1), device=self.local_rank)
-        dist.all_reduce(avg, op=dist.ReduceOp.AVG)
+                totals[0] += outputs.loss.double() * n_tokens
+                totals[1] += n_tokens
+        dist.all_reduce(totals, op=dist.ReduceOp.SUM)
         self.model.train()
-        return avg.item()
-
-    def _run_epoch(self, epoch):
-        b_sz = self.train_data.batch_size
+        loss_sum, n_tokens = totals.tolist()
+        return loss_sum / max(n_tokens, 1)
+
+    def _run_epoch(self, epoch, start_micro_step: int = 0):
+        # With length bucketing the batch sampler owns batch size and shuffling
+        bucketed = self.train_data.batch_size is None
+        sampler = self.train_data.batch_sampler if bucketed else self.train_data.sampler
+        b_sz = self.train_data.batch_size or sampler.batch_size
+        sampler.set_epoch(epoch)   # reshuffle each epoch
+        # Mid-epoch resume: skip consumed micro-batches at the index level, without loading them
+        sampler.set_start(start_micro_step if bucketed else start_micro_step * b_sz)
+        self.epoch = epoch
         if self.global_rank == 0:
             print(f"[GPU0] Epoch {epoch} | Batchsize: {b_sz} | Steps: {len(self.train_data)}", flush=True)
-        self.train_data.sampler.set_epoch(epoch)   # reshuffle each epoch
         self.optimizer.zero_grad(set_to_none=True)
+        self.metrics.start_window()
+        self.loss_sum.zero_()
+        self.loss_steps = 0
 
         t0 = time.time()
-        for micro_step, batch in enumerate(self.train_data):
-            batch = {k: v.to(self.local_rank, non_blocking=True) for k, v in batch.items()}
+        # Batches arrive already on the device (copied ahead on a side stream / thread), counted on the host
+        batches = DevicePrefetcher(self.train_data, self.device, self.prefetch_depth, batch_counts)
+        for micro_step, (counts, batch) in enumerate(self.metrics.timed(batches), start=start_micro_step):
+            self.metrics.add_batch(counts)
             self._run_batch(batch, micro_step)
-
-        # Eval at end of epoch (all ranks run, rank 0 prints)
-        eval_loss = self._run_eval()
+            if self.stop:
+                # Early stop at a step-based eval: keep the stopping point
+                self._save_snapshot(epoch, micro_step + 1)
+                return False
+
+        # Eval at end of epoch (all ranks run, rank 0 prints), unless this step was just evaluated
+        if self.last_eval_step != self.global_step:
+            self._evaluate()
         if self.global_rank == 0:
-            print(
-                f"[GPU0] Epoch {epoch} | eval loss {eval_loss:.4f} "
-                f"| elapsed {time.time()-t0:.1f}s",
-                flush=True,
-            )
-
-    def _save_snapshot(self, epoch):
-        snapshot = {
-            "MODEL_STATE": self.model.module.state_dict(),
-            "EPOCHS_RUN":  epoch,
-            "GLOBAL_STEP": self.global_step,
-        }
-        torch.save(snapshot, self.snapshot_path)
-        print(f"Epoch {epoch} | Training snapshot saved at {self.snapshot_path}")
+            print(f"[GPU0] Epoch {epoch} | elapsed {time.time()-t0:.1f}s", flush=True)
+        return True
+
+    def _save_snapshot(self, epoch, micro_step=None):
+        """micro_step=None: end of epoch. Otherwise the number of micro-batches of `epoch` already consumed."""
+        # All ranks snapshot to host memory; the write happens on a background thread
+        if micro_step is None:
+            extra = {"EPOCHS_RUN": epoch + 1, "MICRO_STEP": 0, "GLOBAL_STEP": self.global_step}
+            name = f"step_{self.global_step:08d}_end"
+        else:
+            extra = {"EPOCHS_RUN": epoch, "MICRO_STEP": micro_step, "GLOBAL_STEP": self.global_step}
+            name = f"step_{self.global_step:08d}"
+        if self.early_stopping is not None:
+            extra["EARLY_STOPPING"] = self.early_stopping.state_dict()
+        self.checkpointer.save(name, self.module, self.optimizer, self.scheduler, extra)
+        if self.global_rank == 0:
+            print(f"Epoch {epoch} | step {self.global_step} | Training snapshot queued for {self.snapshot_path} "
+                  f"(training stalled {self.checkpointer.last_stall_s:.2f}s)", flush=True)
 
     def train(self, max_epochs: int):
         for epoch in range(self.epochs_run, max_epochs):
-            self._run_epoch(epoch)
-            if self.global_rank == 0 and epoch % self.save_every == 0:
+            start = self.resume_micro_step if epoch == self.epochs_run else 0
+            completed = self._run_epoch(epoch, start)   # False: stopped mid-epoch, snapshot already taken
+            if completed and (epoch % self.save_every == 0 or self.stop):
                 self._save_snapshot(epoch)
+            if self.stop:
+                if self.global_rank == 0:
+                    print(f"[GPU0] Early stop at step {self.global_step}: no eval improvement in "
+                          f"{self.early_stopping.patience} evals (best {self.early_stopping.best:.4f})", flush=True)
+                break
+        self.checkpointer.wait()
 
 
 ## Factory: load model, data, optimizer -----------------------------
-def load_train_objs():
-    dataset_path = "/leonardo_work/tra26_minwinsc/DATA/Bitext-customer-support-llm-chatbot-training-dataset"
-    model_id     = "/leonardo_work/tra26_minwinsc/models/Llama-3.2-1B-Instruct"
-    max_seq_len  = 1024
-
-    # Tokenizer
-    tokenizer = AutoTokenizer.from_pretrained(model_id)
-    tokenizer.pad_token = tokenizer.eos_token
-
-    # Dataset: load → format with chat template → tokenize
-    raw = load_from_disk(dataset_path)
-
-    def format_example(example):
-        messages = [
-            {"role": "system",    "content": "You are a helpful and courteous customer support assistant."},
-            {"role": "user",      "content": example["instruction"]},
-            {"role": "assistant", "content": example["response"]},
-        ]
-        example["text"] = tokenizer.apply_chat_template(
-            messages, tokenize=False, add_generation_prompt=False
-        )
-        return example
-
-    def tokenize(batch):
-        return tokenizer(
-            batch["text"],
-            truncation=True,
-            max_length=max_seq_len,
-            padding=False,   # collator pads to longest in batch
-        )
-
-    formatted  = raw.map(format_example, remove_columns=raw.column_names)
-    tokenized  = formatted.map(tokenize, batched=True, remove_columns=["text"])
-    split      = tokenized.train_test_split(test_size=0.1, seed=42)
-    train_set  = split["train"]
-    eval_set   = split["test"]
+def load_train_objs(data: DataConfig):
+    # Tokenizer + dataset: chat template and tokenization run once, in one batched multi-process
+    # pass on rank 0 (or ahead of time via preprocess.py); all ranks mmap the same token cache
+    # and split it the same way as the SFTTrainer backend (preprocess.py)
+    tokenizer, train_set, eval_set = prepare_splits(data, verbose=int(os.environ.get("RANK", 0)) == 0)
 
     # Model
-    model = AutoModelForCausalLM.from_pretrained(model_id, torch_dtype=torch.bfloat16)
-
-    # Optimizer
-    optimizer = torch.optim.AdamW(model.parameters(), lr=2e-5)
+    model = load_model(data)
 
     # Collator (handles dynamic padding + builds `labels` for causal LM)
     collator = DataCollatorForLanguageModeling(tokenizer=tokenizer, mlm=False)
 
-    return train_set, eval_set, model, optimizer, collator
+    return train_set, eval_set, model, collator
 
 
 ## DataLoader factory -----------------------------
-def prepare_dataloader(dataset, batch_size: int, collator, shuffle: bool = True):
+def prepare_dataloader(dataset, batch_size: int, collator, shuffle: bool = True, length_bucketing: bool = False,
+                       num_workers: int = 2, prefetch_factor: int | None = None):
+    # Workers outlive the epoch (samplers run in this process, so set_epoch/set_start still apply)
+    workers = dict(num_workers=num_workers, prefetch_factor=prefetch_factor, persistent_workers=num_workers > 0)
+    if length_bucketing:
+        # Length-sorted global batches dealt evenly across ranks (needs dataset.lengths)
+        return DataLoader(
+            dataset,
+            batch_sampler=LengthBucketBatchSampler(dataset.lengths, batch_size, shuffle=shuffle),
+            pin_memory=torch.cuda.is_available(),
+            collate_fn=collator,
+            **workers,
+        )
     return DataLoader(
         dataset,
         batch_size=batch_size,
-        pin_memory=True,
+        pin_memory=torch.cuda.is_available(),
         shuffle=False,   # DistributedSampler handles ordering
-        sampler=DistributedSampler(dataset, shuffle=shuffle),
+        sampler=ResumableDistributedSampler(dataset, shuffle=shuffle),
         collate_fn=collator,
-        num_workers=2,
+        **workers,
+    )
+
+
+def prepare_eval_dataloader(dataset, batch_size: int, collator, num_workers: int = 2,
+                            prefetch_factor: int | None = None):
+    # Every eval example exactly once across ranks, length-sorted within each rank's share
+    return DataLoader(
+        dataset,
+        batch_size=batch_size,
+        pin_memory=torch.cuda.is_available(),
+        sampler=ShardedEvalSampler(dataset),
+        collate_fn=collator,
+        num_workers=num_workers,
+        prefetch_factor=prefetch_factor,
+        persistent_workers=num_workers > 0,
     )
 
 
 ## Main -----------------------------
 def main(save_every: int, total_epochs: int, batch_size: int, grad_accum_steps: int,
-         snapshot_path: str = "snapshot.pt"):
+         data: DataConfig, snapshot_path: str = "snapshots", packing: bool = False,
+         length_bucketing: bool = False, sharded_checkpoints: bool = False, save_every_steps: int = 0,
+         metrics_file: str | None = None, peak_tflops: float = PEAK_TFLOPS, comm_hook: str = "allreduce",
+         bucket_cap_mb: float = BUCKET_CAP_MB, powersgd_rank: int = POWERSGD_RANK, fsdp: bool = False,
+         activation_checkpointing: str = "off", memory_budget_gb: float | None = None,
+         num_workers: int | None = None, prefetch_factor: int | None = None, prefetch_depth: int = PREFETCH_DEPTH,
+         eval_every_steps: int = 0, early_stopping_patience: int = 0, early_stopping_min_delta: float = 0.0,
+         torch_compile: bool = False, compile_cache_dir: str = COMPILE_CACHE_DIR, adamw_impl: str | None = None,
+         learning_rate: float = TrainConfig.learning_rate, warmup_ratio: float = TrainConfig.warmup_ratio,
+         logging_steps: int = TrainConfig.logging_steps):
     ddp_setup()
-    train_set, eval_set, model, optimizer, collator = load_train_objs()
-    train_data = prepare_dataloader(train_set, batch_size, collator, shuffle=True)
-    eval_data  = prepare_dataloader(eval_set,  batch_size, collator, shuffle=False)
+    train_set, eval_set, model, collator = load_train_objs(data)   # eval_set: the same fixed subset at every eval
+    if fsdp:
+        model = shard_model(model)
+    if activation_checkpointing == "all":
+        checkpoint_blocks(model, range(len(transformer_blocks(model))))
+    elif activation_checkpointing == "auto":
+        # Largest micro-batch that fits the budget (same effective batch), recomputing as few blocks as possible
+        device = local_device()
+        batch_size, grad_accum_steps, report = apply_memory_plan(
+            model.to(device), memory_budget_gb or default_budget_gb(device),
+            batch_size, grad_accum_steps, data.max_seq_len, device, fsdp,
+        )
+        if int(os.environ["RANK"]) == 0:
+            print(report, flush=True)
+    # Optimizer: after sharding, which replaces the parameters with their shards
+    optimizer = adamw(model.parameters(), learning_rate, adamw_impl or ("fused" if torch_compile else "default"))
+    if torch_compile:
+        enable_compile_cache(compile_cache_dir)
+    if packing:
+        # Whole examples packed into max_seq_len blocks; batch_size now counts blocks
+        train_set = PackedDataset(train_set, data.max_seq_len)
+        eval_set  = PackedDataset(eval_set,  data.max_seq_len)
+        collator  = PackedCollator(pad_token_id=collator.tokenizer.pad_token_id)
+        if int(os.environ["RANK"]) == 0:
+            print(train_set.summary(batch_size), flush=True)
+    # Worker count / prefetch factor: measured on this dataset and collator unless given
+    num_workers, prefetch_factor, report = autotune_loader(
+        lambda workers, factor: prepare_dataloader(train_set, batch_size, collator, True, length_bucketing, workers, factor),
+        num_workers, prefetch_factor,
+    )
+    if int(os.environ["RANK"]) == 0:
+        print(report, flush=True)
+    train_data = prepare_dataloader(train_set, batch_size, collator, shuffle=True,  length_bucketing=length_bucketing,
+                                    num_workers=num_workers, prefetch_factor=prefetch_factor)
+    eval_data  = prepare_eval_dataloader(eval_set, batch_size, collator, num_workers, prefetch_factor)
+    if length_bucketing and int(os.environ["RANK"]) == 0:
+        print(train_data.batch_sampler.balance_report(), flush=True)
 
     # Cosine LR schedule with linear warmup
     steps_per_epoch = math.ceil(len(train_data) / grad_accum_steps)
     total_opt_steps = steps_per_epoch * total_epochs
-    warmup_steps    = int(WARMUP_RATIO * total_opt_steps)
+    warmup_steps    = int(warmup_ratio * total_opt_steps)
 
     def cosine_with_warmup(step):
         if step < warmup_steps:
@@ -239,7 +425,22 @@ def main(save_every: int, total_epochs: int, batch_size: int, grad_accum_steps:
 
     trainer = Trainer(
         model, train_data, eval_data, optimizer, scheduler,
-        save_every, snapshot_path, grad_accum_steps,
+        save_every=save_every,
+        snapshot_path=snapshot_path,
+        grad_accum_steps=grad_accum_steps,
+        sharded_checkpoints=sharded_checkpoints,
+        save_every_steps=save_every_steps,
+        metrics_file=metrics_file,
+        peak_tflops=peak_tflops,
+        comm_hook=comm_hook,
+        bucket_cap_mb=bucket_cap_mb,
+        powersgd_rank=powersgd_rank,
+        fsdp=fsdp,
+        prefetch_depth=prefetch_depth,
+        eval_every_steps=eval_every_steps,
+        early_stopping=EarlyStopping(early_stopping_patience, early_stopping_min_delta) if early_stopping_patience else None,
+        compiled=torch_compile,
+        logging_steps=logging_steps,
     )
     trainer.train(total_epochs)
     destroy_process_group()
@@ -248,10 +449,63 @@ def main(save_every: int, total_epochs: int, batch_size: int, grad_accum_steps:
 if __name__ == "__main__":
     import argparse
     parser = argparse.ArgumentParser(description='Llama full fine-tuning with DDP')
-    parser.add_argument('total_epochs', type=int, help='Total epochs to train the model')
-    parser.add_argument('save_every',   type=int, help='How often to save a snapshot')
-    parser.add_argument('--batch_size',       default=2, type=int, help='Per-GPU batch size (default: 2)')
-    parser.add_argument('--grad_accum_steps', default=4, type=int, help='Gradient accumulation steps (default: 4)')
+    parser.add_argument('--config', default=DEFAULT_CONFIG, help='Run config (TOML/YAML, see config.py); the flags below override it')
+    parser.add_argument('total_epochs', nargs='?', type=int, help='Total epochs to train the model (default: from the config)')
+    parser.add_argument('save_every',   nargs='?', type=int, help='How often to save a snapshot (default: from the config)')
+    parser.add_argument('--batch_size',       type=int, help='Per-GPU batch size (default: from the config)')
+    parser.add_argument('--grad_accum_steps', type=int, help='Gradient accumulation steps (default: from the config)')
+    parser.add_argument('--learning_rate', type=float, help='Peak learning rate (default: from the config)')
+    parser.add_argument('--warmup_ratio', type=float, help='Fraction of the steps spent in linear warmup (default: from the config)')
+    parser.add_argument('--logging_steps', type=int, help='Optimizer steps per metrics line (default: from the config)')
+    parser.add_argument('--token_cache_dir', help='Where the pre-tokenized dataset is cached (default: from the config)')
+    parser.add_argument('--num_proc', type=int, help=f'Tokenization processes on a cache miss (default: from the config, else {NUM_PROC})')
+    parser.add_argument('--num_workers', default=None, type=int, help='DataLoader workers per rank (default: autotuned)')
+    parser.add_argument('--prefetch_factor', default=None, type=int, help='Batches queued per DataLoader worker (default: autotuned)')
+    parser.add_argument('--prefetch_depth', default=PREFETCH_DEPTH, type=int, help=f'Batches copied to the device ahead of the current one (default: {PREFETCH_DEPTH})')
+    parser.add_argument('--eval_every_steps', default=0, type=int, help='Also evaluate every N optimizer steps, mid-epoch (0: epoch end only)')
+    parser.add_argument('--eval_samples', type=int, help='Evaluate on a fixed subset of N eval examples (0: the whole split; default: from the config)')
+    parser.add_argument('--early_stopping_patience', default=0, type=int, help='Stop after N evals without improvement (0: off)')
+    parser.add_argument('--early_stopping_min_delta', default=0.0, type=float, help='Smallest eval loss decrease that counts as improvement')
+    parser.add_argument('--compile', action='store_true', help='torch.compile the model (reports graph breaks) and default to fused AdamW')
+    parser.add_argument('--compile_cache_dir', default=COMPILE_CACHE_DIR, help='Persistent cache for compiled kernels, reused across restarts')
+    parser.add_argument('--adamw_impl', default=None, choices=ADAMW_IMPLS, help='AdamW implementation (default: fused with --compile, else default)')
+    parser.add_argument('--packing', action='store_true', help='Pack examples into max_seq_len blocks instead of padding')
+    parser.add_argument('--length_bucketing', action='store_true', help='Batch similar lengths together, balanced across ranks')
+    parser.add_argument('--snapshot_dir', help='Checkpoint directory (a legacy snapshot.pt file also loads; default: [train] output_dir)')
+    parser.add_argument('--sharded_checkpoints', action='store_true', help='Split checkpoint writes across all ranks')
+    parser.add_argument('--save_every_steps', default=0, type=int, help='Also snapshot every N optimizer steps, mid-epoch (0: off)')
+    parser.add_argument('--metrics_file', default=None, help='Append per-window throughput/MFU records (JSONL)')
+    parser.add_argument('--peak_tflops', default=PEAK_TFLOPS, type=float, help='Per-GPU peak TFLOPs for MFU (default: A100 bf16)')
+    parser.add_argument('--comm_hook', default='allreduce', choices=COMM_HOOKS, help='Gradient all-reduce: plain, fp16/bf16 compressed or PowerSGD')
+    parser.add_argument('--bucket_cap_mb', default=BUCKET_CAP_MB, type=float, help=f'DDP gradient bucket size in MB (default: {BUCKET_CAP_MB})')
+    parser.add_argument('--powersgd_rank', default=POWERSGD_RANK, type=int, help=f'PowerSGD approximation rank (default: {POWERSGD_RANK})')
+    parser.add_argument('--fsdp', action='store_true', help='Shard weights, gradients and optimizer state across ranks (FSDP2)')
+    parser.add_argument('--activation_checkpointing', default='off', choices=['off', 'all', 'auto'], help='Recompute transformer blocks in backward; auto: plan for --memory_budget_gb')
+    parser.add_argument('--memory_budget_gb', default=None, type=float, help='Per-GPU memory budget for --activation_checkpointing auto (default: GPU memory)')
+    # Config file first, then the flags on top of it
+    config = load_config(parser.parse_known_args()[0].config)
+    train = config.train
+    parser.set_defaults(
+        total_epochs=train.total_epochs, save_every=train.save_every, batch_size=train.batch_size,
+        grad_accum_steps=train.grad_accum_steps, learning_rate=train.learning_rate, warmup_ratio=train.warmup_ratio,
+        logging_steps=train.logging_steps, snapshot_dir=train.output_dir, token_cache_dir=config.data.token_cache_dir,
+        num_proc=config.data.num_proc, eval_samples=config.data.eval_samples,
+    )
+    parser.set_defaults(**parser_defaults(parser, config.ddp))
     args = parser.parse_args()
-
-    main(args.save_every, args.total_epochs, args.batch_size, args.grad_accum_steps)
+    data = dataclasses.replace(config.data, token_cache_dir=args.token_cache_dir, num_proc=args.num_proc,
+                               eval_samples=args.eval_samples)
+
+    main(args.save_every, args.total_epochs, args.batch_size, args.grad_accum_steps, data,
+         snapshot_path=args.snapshot_dir, packing=args.packing,
+         length_bucketing=args.length_bucketing, sharded_checkpoints=args.sharded_checkpoints,
+         save_every_steps=args.save_every_steps, metrics_file=args.metrics_file, peak_tflops=args.peak_tflops,
+         comm_hook=args.comm_hook, bucket_cap_mb=args.bucket_cap_mb, powersgd_rank=args.powersgd_rank,
+         fsdp=args.fsdp, activation_checkpointing=args.activation_checkpointing,
+         memory_budget_gb=args.memory_budget_gb, num_workers=args.num_workers,
+         prefetch_factor=args.prefetch_factor, prefetch_depth=args.prefetch_depth,
+         eval_every_steps=args.eval_every_steps,
+         early_stopping_patience=args.early_stopping_patience,
+         early_stopping_min_delta=args.early_stopping_min_delta, torch_compile=args.compile,
+         compile_cache_dir=args.compile_cache_dir, adamw_impl=args.adamw_impl, learning_rate=args.learning_rate,
+         warmup_ratio=args.warmup_ratio, logging_steps=args.logging_steps)
@@ -1,116 +1,118 @@
-import torch
-from transformers import AutoModelForCausalLM, AutoTokenizer, TrainingArguments, BitsAndBytesConfig
-from trl import SFTTrainer
-from accelerate import Accelerator
-from datasets import load_from_disk
-import time
+"""
+Llama full fine-tuning with accelerate + TRL's SFTTrainer: the high-level
+counterpart of fine_tuning_ddp.py, driven by the same run config (config.py).
+
+Tokenizer, token cache, train/eval split and model loading come from
+preprocess.py, exactly as in fine_tuning_ddp.py: the chat template and
+tokenization run once into the shared token cache, and SFTTrainer gets the
+pre-tokenized input_ids of the same split. Both backends therefore train on
+identical inputs with the same [train] hyper-parameters, so their throughput
+and loss curves can be compared directly.
 
-# Accelerate initialization
-accelerator = Accelerator()
-device = accelerator.device 
+Usage:
+    accelerate launch fine_tuning_ddp_accelerate.py --config configs/leonardo.toml
+"""
 
+import argparse
 
-# --- Configurazione ---
-dataset_path= #############path_here
-model_id = ###############path_here
+import torch
+from accelerate import Accelerator
+from trl import SFTConfig, SFTTrainer
 
-# Caricamento del tokenizer
-tokenizer = AutoTokenizer.from_pretrained(model_id)
-tokenizer.pad_token = tokenizer.eos_token
+from config import DEFAULT_CONFIG, load_config
+from preprocess import load_model, prepare_splits, to_hf_dataset
 
 
-# Caricamento del modello in 4-bit per QLoRA
-model = AutoModelForCausalLM.from_pretrained(
-    model_id,
-    torch_dtype=torch.bfloat16, # O torch.float16 se la tua GPU non supporta bfloat16
-    device_map=device # Copy the model on each GPU
-)
 #----- model GPUs occupancy ------------------
-import GPUtil
-
 def print_gpu_utilization():
+    import GPUtil
     gpus = GPUtil.getGPUs()
     for gpu in gpus:
         print(f"GPU id: {gpu.id}, name: {gpu.name}")
         print(f"  Load: {gpu.load * 100:.1f}%")
         print(f"  Memory Used: {gpu.memoryUsed}MB / {gpu.memoryTotal}MB")
 
-if accelerator.is_main_process: print_gpu_utilization()
-#-----------------------------------------------
-
-# --- 2. Preparazione dei Dati ---
-dataset = load_from_disk(dataset_path) 
-
-def format_example_for_llama3(example):
-    user_instruction = example['instruction']
-    assistant_response = example['response']  
-
-    messages = [
-        {"role": "system", "content": "You are a helpful and courteous customer support assistant."},
-        {"role": "user", "content": user_instruction},
-        {"role": "assistant", "content": assistant_response}
-    ]
-
-    example["text"] = tokenizer.apply_chat_template(messages, tokenize=False, add_generation_prompt=False)
-    return example
-
-processed_dataset = dataset.map(format_example_for_llama3, remove_columns=dataset.column_names)
-
-train_dataset = processed_dataset.train_test_split(test_size=0.1, seed=42)["train"]
-eval_dataset = processed_dataset.train_test_split(test_size=0.1, seed=42)["test"]
-
-
-# --- 3. Configurazione Argomenti di Training ---
-training_args = TrainingArguments(
-    output_dir="./output",
-    num_train_epochs= ##################### COMPLETE HERE ##########################################
-    per_device_train_batch_size= ####################### COMPLETE HERE ###########################
-    gradient_accumulation_steps=4,
-    gradient_checkpointing=False,
-    optim="adamw_torch", # Ottimizzatore standard per full fine-tuning
-    learning_rate=2e-5, # Tasso di apprendimento tipicamente più basso per full fine-tuning (es. 1e-5 a 5e-5)
-    lr_scheduler_type="cosine",
-    ddp_find_unused_parameters=False,
-    warmup_ratio=0.03,
-    logging_steps=25,
-    save_strategy="no",
-    eval_strategy="no",
-    bf16=True,
-    push_to_hub=False,
-    report_to="none",
-    remove_unused_columns=False,
-    prediction_loss_only = True,
-)
-
-
-#-------- useful logs ----------------------------------------------
-if accelerator.is_main_process:
-        print("Model:", model_id)
-        print("Parallelization technique: FSDP")
+
+def main(config_path: str, output_dir: str | None = None):
+    # Accelerate initialization
+    accelerator = Accelerator()
+    device = accelerator.device
+    config = load_config(config_path)
+    data, train = config.data, config.train
+
+    # --- 1. Dati: token cache + split condivisi con fine_tuning_ddp.py (preprocess.py) ---
+    # Il rank 0 costruisce la cache al primo avvio, gli altri aspettano sulla barrier
+    tokenizer, train_set, eval_set = prepare_splits(data, verbose=accelerator.is_main_process)
+    train_dataset = to_hf_dataset(train_set)
+    eval_dataset  = to_hf_dataset(eval_set)
+
+    # --- 2. Modello: una copia su ogni GPU ---
+    model = load_model(data, device_map=device)
+    if accelerator.is_main_process:
+        print_gpu_utilization()
+
+    # --- 3. Configurazione Argomenti di Training ([train] della config) ---
+    training_args = SFTConfig(
+        output_dir=output_dir or train.output_dir,
+        num_train_epochs=train.total_epochs,
+        per_device_train_batch_size=train.batch_size,
+        per_device_eval_batch_size=train.batch_size,
+        gradient_accumulation_steps=train.grad_accum_steps,
+        gradient_checkpointing=False,
+        optim="adamw_torch", # Ottimizzatore standard per full fine-tuning
+        learning_rate=train.learning_rate,
+        lr_scheduler_type="cosine",
+        ddp_find_unused_parameters=False,
+        warmup_ratio=train.warmup_ratio,
+        logging_steps=train.logging_steps,
+        max_length=data.max_seq_len, # gli esempi sono già troncati nella token cache
+        save_strategy="no",
+        eval_strategy="no",
+        bf16=True,
+        push_to_hub=False,
+        report_to="none",
+        remove_unused_columns=False,
+        prediction_loss_only=True,
+    )
+
+    #-------- useful logs ----------------------------------------------
+    if accelerator.is_main_process:
+        print("Model:", data.model_id)
+        print("Config:", config_path)
         print("GPU Batch Size:", training_args.per_device_train_batch_size)
         print("Learning rate:", training_args.learning_rate)
-        print("Max steps:", training_args.max_steps)
         print("Epochs:", training_args.num_train_epochs)
         print("Gradient Accumulation steps:", training_args.gradient_accumulation_steps)
-#-----------------------------------------------------------------------------------
-
-# --- 4. Inizializzazione e Avvio del SFTTrainer ---
-trainer = SFTTrainer(
-    model=model,
-    train_dataset=train_dataset,
-    eval_dataset=eval_dataset,
-    args=training_args
-)
-if accelerator.is_main_process:
-   print("Starting Full Fine-tuning...")
-trainer.train()
-
-if accelerator.is_main_process:
-   print("Full Fine-tuning completed...")
-
-
-# Libera la memoria GPU
-del model
-del trainer
-torch.cuda.empty_cache()
-
+    #-----------------------------------------------------------------------------------
+
+    # --- 4. Inizializzazione e Avvio del SFTTrainer ---
+    # input_ids già pronti: SFTTrainer salta template e tokenizzazione
+    trainer = SFTTrainer(
+        model=model,
+        train_dataset=train_dataset,
+        eval_dataset=eval_dataset,
+        processing_class=tokenizer,
+        args=training_args,
+    )
+    if accelerator.is_main_process:
+        print("Starting Full Fine-tuning...")
+    trainer.train()
+    # Stessa eval (stesso sottoinsieme) di fine_tuning_ddp.py, per confrontare i due backend
+    eval_loss = trainer.evaluate()["eval_loss"]
+    if accelerator.is_main_process:
+        print("Full Fine-tuning completed...")
+        print(f"Eval loss: {eval_loss:.4f}")
+
+    # Libera la memoria GPU
+    del model
+    del trainer
+    torch.cuda.empty_cache()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Llama full fine-tuning with accelerate + SFTTrainer")
+    parser.add_argument("--config",     default=DEFAULT_CONFIG, help="Run config (TOML/YAML, see config.py), shared with fine_tuning_ddp.py")
+    parser.add_argument("--output_dir", default=None,           help="SFTTrainer output directory (default: [train] output_dir)")
+    args = parser.parse_args()
+
+    main(args.config, args.output_dir)
@@ -0,0 +1,183 @@
+"""
+Throughput / utilization metrics for the DDP Trainer.
+
+Every rank accumulates cheap host-side counters over a logging window:
+tokens and samples fed, time blocked waiting for the next batch (the data
+stall, also reported per optimizer step, for the slowest rank), and time
+spent in gradient all-reduce (timed by a DDP comm hook wrapper). At the window
+boundary there is one device synchronize and one all_gather of a small
+vector. Rank 0 then prints the aggregated line and optionally appends it to
+a JSONL file, so separate runs can be diffed for regressions.
+
+Tokens are counted as loss-bearing positions (labels != -100) on the host
+before the batch is copied to the device, so counting never syncs.
+MFU = achieved model FLOPs / (peak FLOPs x world size). Model FLOPs per
+token are 6 x params plus the attention term 12 x layers x hidden x seq_len
+(Kaplan et al. / PaLM appendix B).
+"""
+
+import json
+import resource
+import time
+
+import torch
+import torch.distributed as dist
+from torch.distributed.algorithms.ddp_comm_hooks import default_hooks
+
+from packing import IGNORE_INDEX
+
+# Dense bf16 peak of an A100 (Leonardo Booster); override with --peak_tflops
+PEAK_TFLOPS  = 312.0
+
+# Per-rank window vector, gathered to every rank at log boundaries
+FIELDS = ("tokens", "samples", "seq_tokens", "steps", "data_wait_s", "allreduce_s", "wall_s", "peak_mem_gb", "loss")
+
+
+## Comm hook timing -----------------------------
+class CommTimer:
+    """Wraps a DDP comm hook and accumulates the time from bucket launch to reduced result."""
+    def __init__(self, hook=default_hooks.allreduce_hook, state=None):
+        self.hook = hook
+        self.state = state
+        self.cuda = torch.cuda.is_available()
+        self.pending = []       # (start, end) CUDA events, resolved at flush
+        self.elapsed_s = 0.0
+
+    @staticmethod
+    def ddp_hook(timer: "CommTimer", bucket):
+        if timer.cuda:
+            start, end = torch.cuda.Event(enable_timing=True), torch.cuda.Event(enable_timing=True)
+            start.record()
+        else:
+            t0 = time.perf_counter()
+        fut = timer.hook(timer.state, bucket)
+
+        def done(fut):
+            if timer.cuda:
+                end.record()
+                timer.pending.append((start, end))
+            else:
+                timer.elapsed_s += time.perf_counter() - t0
+            return fut.value()
+        return fut.then(done)
+
+    def take(self) -> float:
+        """Seconds accumulated since the last call (device must be synchronized)."""
+        total = self.elapsed_s + sum(s.elapsed_time(e) for s, e in self.pending) / 1e3
+        self.pending.clear()
+        self.elapsed_s = 0.0
+        return total
+
+
+## Metrics -----------------------------
+def model_flops_per_token(model: torch.nn.Module, seq_len: float) -> float:
+    n_params = sum(p.numel() for p in model.parameters())
+    cfg = getattr(model, "config", None)
+    attention = 12 * cfg.num_hidden_layers * cfg.hidden_size * seq_len if cfg is not None else 0
+    return 6 * n_params + attention
+
+
+def peak_memory_gb() -> float:
+    if torch.cuda.is_available():
+        return torch.cuda.max_memory_allocated() / 1e9
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1e6   # KiB -> GB (Linux)
+
+
+def batch_counts(batch: dict) -> tuple[int, int, int]:
+    """(loss-bearing tokens, samples, sequence positions) of a batch still on the host."""
+    return int(batch["labels"].ne(IGNORE_INDEX).sum()), batch["input_ids"].shape[0], batch["input_ids"].numel()
+
+
+class TrainMetrics:
+    def __init__(self, model: torch.nn.Module, global_rank: int, metrics_file: str | None = None,
+                 peak_tflops: float = PEAK_TFLOPS, comm: CommTimer | None = None):
+        self.model = model
+        self.global_rank = global_rank
+        self.metrics_file = metrics_file
+        self.peak_flops = peak_tflops * 1e12
+        self.comm = comm or CommTimer()
+        self.start_window()
+
+    def start_window(self):
+        self.tokens = self.samples = self.seq_tokens = self.batches = 0
+        self.data_wait_s = 0.0
+        self.t_window = time.perf_counter()
+        if torch.cuda.is_available():
+            torch.cuda.reset_peak_memory_stats()
+
+    def timed(self, loader):
+        """Iterate a DataLoader (or prefetcher), charging the time spent waiting on it to data_wait_s."""
+        it = iter(loader)
+        while True:
+            t0 = time.perf_counter()
+            batch = next(it, None)
+            self.data_wait_s += time.perf_counter() - t0
+            if batch is None:
+                return
+            yield batch
+
+    def add_batch(self, counts: tuple[int, int, int]) -> None:
+        """Count a batch from its batch_counts(), taken while it was still on the host."""
+        tokens, samples, seq_tokens = counts
+        self.tokens += tokens
+        self.samples += samples
+        self.seq_tokens += seq_tokens
+        self.batches += 1
+
+    def flush(self, step: int, epoch: int, lr: float, loss: torch.Tensor, device, steps: int | None = None) -> dict | None:
+        """
+        End the window on every rank (collective); rank 0 prints and returns the aggregated record.
+        `loss` is this rank's on-device window loss; it joins the gathered vector without a separate .item().
+        `steps`: optimizer steps in the window, for the per-step data stall (default: micro-batches).
+        """
+        if torch.cuda.is_available():
+            torch.cuda.synchronize()
+        local = torch.cat([torch.tensor([
+            self.tokens, self.samples, self.seq_tokens, steps or self.batches, self.data_wait_s, self.comm.take(),
+            time.perf_counter() - self.t_window, peak_memory_gb(),
+        ], dtype=torch.float64, device=device), loss.detach().to(torch.float64).view(1)])
+        gathered = [torch.empty_like(local) for _ in range(dist.get_world_size())]
+        dist.all_gather(gathered, local)
+        self.start_window()
+        if self.global_rank != 0:
+            return None
+
+        per_rank = {f: [g[i].item() for g in gathered] for i, f in enumerate(FIELDS)}
+        world = len(gathered)
+        wall = max(per_rank["wall_s"])
+        tokens = sum(per_rank["tokens"])
+        loss = sum(per_rank["loss"]) / world
+        seq_len = sum(per_rank["seq_tokens"]) / max(1, sum(per_rank["samples"]))
+        achieved = tokens * model_flops_per_token(self.model, seq_len) / wall
+        record = {
+            "step":            step,
+            "epoch":           epoch,
+            "time":            time.time(),
+            "world_size":      world,
+            "loss":            loss,
+            "lr":              lr,
+            "tokens_per_s":    tokens / wall,
+            "samples_per_s":   sum(per_rank["samples"]) / wall,
+            "data_wait_s":     sum(per_rank["data_wait_s"]) / world,
+            "data_wait_max_s": max(per_rank["data_wait_s"]),
+            "data_stall_ms_per_step": 1e3 * max(w / max(1, n) for w, n in zip(per_rank["data_wait_s"], per_rank["steps"])),
+            "compute_s":       wall - sum(per_rank["data_wait_s"]) / world,
+            "allreduce_s":     sum(per_rank["allreduce_s"]) / world,
+            "window_s":        wall,
+            "peak_mem_gb":     max(per_rank["peak_mem_gb"]),
+            "rank_tokens_min": min(per_rank["tokens"]),
+            "rank_tokens_max": max(per_rank["tokens"]),
+            "mfu":             achieved / (self.peak_flops * world),
+        }
+        print(
+            f"step {step:>6} | loss {loss:.4f} | lr {lr:.2e} "
+            f"| {record['tokens_per_s']:,.0f} tok/s | {record['samples_per_s']:.1f} samples/s "
+            f"| data {record['data_wait_s']:.2f}s ({record['data_stall_ms_per_step']:.1f}ms/step) compute {record['compute_s']:.2f}s "
+            f"allreduce {record['allreduce_s']:.2f}s | mem {record['peak_mem_gb']:.1f}GB "
+            f"| MFU {record['mfu']:.1%}",
+            flush=True,
+        )
+        if self.metrics_file:
+            with open(self.metrics_file, "a") as fh:
+                fh.write(json.dumps(record) + "\n")
+        return record
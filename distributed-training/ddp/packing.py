@@ -0,0 +1,123 @@
+"""
+Sequence packing: concatenate tokenized examples into blocks of at most
+max_seq_len tokens so batches carry (almost) no pad tokens.
+
+Examples are never split across blocks. Inside a block, each example gets its
+own position ids (restarting at 0) and a block-diagonal causal attention mask,
+so no token attends across an example boundary and the logits match running
+each example on its own. The first token of every example is excluded from
+the loss, so the last token of one example never learns to predict the next.
+"""
+
+import bisect
+
+import numpy as np
+import torch
+from torch.utils.data import Dataset
+
+IGNORE_INDEX = -100
+
+
+## Packing -----------------------------
+def pack_examples(lengths, max_seq_len: int) -> list[list[int]]:
+    """Best-fit decreasing bin packing of example indices into blocks of <= max_seq_len tokens."""
+    order = np.argsort(-np.asarray(lengths), kind="stable")
+    blocks: list[list[int]] = []
+    free: list[tuple[int, int]] = []   # sorted (remaining capacity, block id)
+    for i in order:
+        n = min(int(lengths[i]), max_seq_len)
+        pos = bisect.bisect_left(free, (n, -1))
+        if pos == len(free):
+            blocks.append([int(i)])
+            remaining, block = max_seq_len - n, len(blocks) - 1
+        else:
+            remaining, block = free.pop(pos)
+            blocks[block].append(int(i))
+            remaining -= n
+        if remaining > 0:
+            bisect.insort(free, (remaining, block))
+    return blocks
+
+
+def padding_fraction(lengths, batch_size: int, seed: int = 0) -> float:
+    """Share of pad tokens when shuffled examples are padded to the longest in each batch."""
+    lengths = np.random.default_rng(seed).permutation(np.asarray(lengths))
+    n = len(lengths) // batch_size * batch_size
+    if n == 0:
+        return 0.0
+    batches = lengths[:n].reshape(-1, batch_size)
+    padded = batches.max(axis=1).sum() * batch_size
+    return 1.0 - batches.sum() / padded
+
+
+class PackedDataset(Dataset):
+    """
+    Blocks of whole examples from a dataset with a `lengths` array (TokenCacheDataset).
+    Items are {"input_ids": ndarray, "seq_lens": list[int]}; PackedCollator turns
+    them into batches.
+    """
+    def __init__(self, dataset, max_seq_len: int):
+        self.dataset = dataset
+        self.max_seq_len = max_seq_len
+        self.example_lengths = np.minimum(np.asarray(dataset.lengths), max_seq_len)
+        self.blocks = pack_examples(self.example_lengths, max_seq_len)
+        self.lengths = np.array([self.example_lengths[b].sum() for b in self.blocks])
+
+    def __len__(self):
+        return len(self.blocks)
+
+    def __getitem__(self, idx):
+        parts = [np.asarray(self.dataset[i]["input_ids"][:self.max_seq_len]) for i in self.blocks[idx]]
+        return {"input_ids": np.concatenate(parts), "seq_lens": [len(p) for p in parts]}
+
+    def summary(self, batch_size: int) -> str:
+        tokens = int(self.example_lengths.sum())
+        return (
+            f"packing: {len(self.dataset):,} examples -> {len(self):,} blocks of <= {self.max_seq_len} tokens "
+            f"| padding {padding_fraction(self.example_lengths, batch_size):.1%} -> "
+            f"{padding_fraction(self.lengths, batch_size):.1%} "
+            f"| fill {tokens / (len(self) * self.max_seq_len):.1%}"
+        )
+
+
+## Collator -----------------------------
+class PackedCollator:
+    """
+    Pads packed blocks to the longest block in the batch and builds labels,
+    per-example position_ids and an additive [B, 1, L, L] block-diagonal causal
+    mask (works with the eager and sdpa attention implementations).
+    """
+    def __init__(self, pad_token_id: int):
+        self.pad_token_id = pad_token_id
+
+    def __call__(self, features):
+        length = max(len(f["input_ids"]) for f in features)
+        batch_size = len(features)
+        input_ids    = torch.full((batch_size, length), self.pad_token_id, dtype=torch.long)
+        labels       = torch.full((batch_size, length), IGNORE_INDEX, dtype=torch.long)
+        position_ids = torch.zeros((batch_size, length), dtype=torch.long)
+        segments     = torch.full((batch_size, length), -1, dtype=torch.long)   # -1 = padding
+
+        for row, f in enumerate(features):
+            ids = torch.as_tensor(np.asarray(f["input_ids"], dtype=np.int64))
+            input_ids[row, :len(ids)] = ids
+            labels[row, :len(ids)] = ids
+            start = 0
+            for seg, n in enumerate(f["seq_lens"]):
+                position_ids[row, start:start + n] = torch.arange(n)
+                segments[row, start:start + n] = seg
+                labels[row, start] = IGNORE_INDEX   # never predict across a boundary
+                start += n
+
+        causal = torch.ones(length, length, dtype=torch.bool).tril()
+        # Padding forms its own segment, so no softmax row is fully masked
+        allowed = (segments[:, :, None] == segments[:, None, :]) & causal
+        attention_mask = torch.zeros(batch_size, 1, length, length).masked_fill(
+            ~allowed[:, None], torch.finfo(torch.float32).min
+        )
+        return {
+            "input_ids":      input_ids,
+            "labels":         labels,
+            "position_ids":   position_ids,
+            "attention_mask": attention_mask,
+        }
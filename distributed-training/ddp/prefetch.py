@@ -0,0 +1,181 @@
+"""
+Overlapped host-to-device batch prefetching and DataLoader auto-tuning.
+
+Copying a batch right before its forward pass leaves little to overlap, even
+from pinned memory: the compute stream waits for the copy. DevicePrefetcher
+keeps the next `depth` batches already in flight instead. On CUDA the copies
+are issued on a side stream, and the compute stream waits on a per-batch
+event only when that batch is consumed; record_stream() keeps the caching
+allocator from handing its memory back early. On CPU there is no copy to
+hide, so a background thread pulls batches from the DataLoader (worker
+results, collation without workers) while the step runs.
+
+Host-side statistics (token counts for metrics or the eval loss weights) are
+computed by host_fn on each batch before the copy and travel with it, so
+counting never syncs.
+
+autotune_loader() picks num_workers and prefetch_factor from per-rank
+measurements: every rank times the per-batch cost in-process, then the
+throughput of each worker count up to its share of the CPUs, all at once.
+The ranks' results are gathered and the slowest rank's are used: the
+smallest worker count within AUTOTUNE_TOLERANCE of the best, and a
+prefetch_factor sized so the queued batches absorb the slowest batches (long
+dialogs) seen while timing. Every rank gets the same settings.
+"""
+
+import math
+import os
+import queue
+import threading
+import time
+from collections import deque
+
+import torch
+import torch.distributed as dist
+
+PREFETCH_DEPTH      = 2      # batches staged on the device ahead of the one being computed
+AUTOTUNE_BATCHES    = 20     # timed batches per candidate, after startup
+AUTOTUNE_TOLERANCE  = 0.10   # fewer workers win if within 10% of the fastest
+MAX_PREFETCH_FACTOR = 8
+_DONE = object()
+
+
+## Prefetching -----------------------------
+class DevicePrefetcher:
+    """Iterates a DataLoader as (host_fn(batch), batch on device) pairs, `depth` batches ahead."""
+    def __init__(self, loader, device: torch.device, depth: int = PREFETCH_DEPTH, host_fn=None):
+        self.loader = loader
+        self.device = device
+        self.depth = max(1, depth)
+        self.host_fn = host_fn
+
+    def __len__(self):
+        return len(self.loader)
+
+    def __iter__(self):
+        return self._stream_iter() if self.device.type == "cuda" else self._thread_iter()
+
+    def _stage(self, batch: dict):
+        info = self.host_fn(batch) if self.host_fn is not None else None
+        return info, {k: v.to(self.device, non_blocking=True) for k, v in batch.items()}
+
+    def _stream_iter(self):
+        copy_stream = torch.cuda.Stream(self.device)
+        compute_stream = torch.cuda.current_stream(self.device)
+        staged = deque()
+        it = iter(self.loader)
+
+        def fill():
+            while len(staged) < self.depth:
+                batch = next(it, None)
+                if batch is None:
+                    return
+                with torch.cuda.stream(copy_stream):
+                    info, batch = self._stage(batch)
+                    ready = torch.cuda.Event()
+                    ready.record(copy_stream)
+                staged.append((info, batch, ready))
+
+        fill()
+        while staged:
+            info, batch, ready = staged.popleft()
+            compute_stream.wait_event(ready)
+            for v in batch.values():
+                v.record_stream(compute_stream)
+            fill()   # queue the next copy before handing this batch out, so it overlaps this step
+            yield info, batch
+
+    def _thread_iter(self):
+        staged = queue.Queue(maxsize=self.depth)
+        stop = threading.Event()
+
+        def put(item) -> bool:
+            while not stop.is_set():
+                try:
+                    staged.put(item, timeout=0.1)
+                    return True
+                except queue.Full:
+                    pass
+            return False
+
+        def produce():
+            try:
+                for batch in self.loader:
+                    if not put(self._stage(batch)):
+                        return
+                put(_DONE)
+            except Exception as e:   # re-raised in the training loop
+                put(e)
+
+        thread = threading.Thread(target=produce, name="prefetch", daemon=True)
+        thread.start()
+        try:
+            while (item := staged.get()) is not _DONE:
+                if isinstance(item, Exception):
+                    raise item
+                yield item
+        finally:
+            stop.set()   # consumer stopped early (or finished): let the producer exit
+            thread.join()
+
+
+## Auto-tuning -----------------------------
+def cpu_share() -> int:
+    """CPUs of this job divided among the ranks on this node."""
+    return max(1, len(os.sched_getaffinity(0)) // int(os.environ.get("LOCAL_WORLD_SIZE", 1)))
+
+
+def _batch_times(loader, batches: int) -> list[float]:
+    """Seconds per batch for up to `batches` batches, after the first (worker startup)."""
+    it = iter(loader)
+    next(it, None)
+    times = []
+    for _ in range(batches):
+        t0 = time.perf_counter()
+        if next(it, None) is None:
+            break
+        times.append(time.perf_counter() - t0)
+    return times
+
+
+def autotune_loader(make_loader, num_workers: int | None = None, prefetch_factor: int | None = None,
+                    batches: int = AUTOTUNE_BATCHES) -> tuple[int, int | None, str]:
+    """
+    Measure the num_workers and prefetch_factor to build the DataLoader with: make_loader(num_workers,
+    prefetch_factor) -> DataLoader. Values given are kept. Every rank times its own loader at the same
+    time, so their workers compete for the node's cores as in training, and the slowest rank's numbers
+    decide for all of them. Returns num_workers, prefetch_factor (None without workers) and a report.
+    """
+    if num_workers == 0 or (num_workers is not None and prefetch_factor is not None):
+        # Nothing to tune: same arguments on every rank, so all of them skip the timing and the collective
+        prefetch_factor = prefetch_factor if num_workers else None
+        return num_workers, prefetch_factor, (f"DataLoader autotune | skipped, given num_workers {num_workers}, "
+                                              f"prefetch_factor {prefetch_factor}")
+    costs = _batch_times(make_loader(0, None), batches)   # in-process: each batch's own cost
+    rates = {}
+    if num_workers is None:
+        for workers in [0] + [2 ** i for i in range(int(math.log2(cpu_share())) + 1)]:
+            times = costs if workers == 0 else _batch_times(make_loader(workers, 2), batches)
+            rates[workers] = len(times) / max(sum(times), 1e-9)
+    mine = (sum(costs) / max(1, len(costs)), max(costs, default=0.0), rates)
+    measured = [mine]
+    if dist.is_initialized():
+        measured = [None] * dist.get_world_size()
+        dist.all_gather_object(measured, mine)
+    # Slowest rank: highest batch costs, lowest rate of each worker count every rank tried
+    mean_cost = max(m[0] for m in measured)
+    max_cost  = max(m[1] for m in measured)
+    rates = {w: min(m[2][w] for m in measured) for w in rates if all(w in m[2] for m in measured)}
+    if num_workers is None:
+        best = max(rates.values())
+        num_workers = min(w for w, r in rates.items() if r >= (1 - AUTOTUNE_TOLERANCE) * best)
+    if num_workers == 0:
+        prefetch_factor = None
+    elif prefetch_factor is None:
+        # Each worker's queue should cover a slow batch at the mean rate
+        prefetch_factor = min(MAX_PREFETCH_FACTOR, max(2, math.ceil(max_cost / max(mean_cost, 1e-9))))
+    tried = ", ".join(f"{w}: {r:.0f}/s" for w, r in rates.items()) or "fixed"
+    report = (f"DataLoader autotune | slowest of {len(measured)} ranks | {mean_cost * 1e3:.1f} ms/batch in-process, "
+              f"max {max_cost * 1e3:.1f} ms | workers {tried} "
+              f"| num_workers {num_workers}, prefetch_factor {prefetch_factor} (cpu share {cpu_share()})")
+    return num_workers, prefetch_factor, report
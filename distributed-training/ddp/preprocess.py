@@ -0,0 +1,201 @@
+"""
+Data and model preparation shared by both training backends, fine_tuning_ddp.py
+(raw DDP/FSDP) and fine_tuning_ddp_accelerate.py (SFTTrainer), driven by the
+[data] section of the run config (config.py): chat template + tokenization in
+one batched, multi-process datasets.map pass, written to the token cache
+(token_cache.py), then one train/eval split of the cached examples.
+
+Each batch of rows is rendered with the chat template and tokenized in a
+single call (the fast tokenizer encodes the whole batch at once), and the
+batches are spread over NUM_PROC processes. The token ids are the same as
+rendering and tokenizing in two passes, so existing caches stay valid.
+
+With [data] model_cache_dir set, the model and tokenizer are loaded from a
+bf16 safetensors snapshot of model_id, written there once and keyed by
+model_id and its files' sizes and mtimes: an fp32 or .bin checkpoint is
+converted once instead of by every rank of every run, and both backends load
+the same snapshot.
+
+Inside a torchrun job only rank 0 does this, on a cache miss, while the other
+ranks wait on a barrier; run this script beforehand (no GPUs or torchrun
+needed) to build the caches outside the training allocation. Every stage is
+timed:
+
+  model cache                    finding (on a miss, writing) the model snapshot
+  load tokenizer, load dataset   reading the model's tokenizer and the raw dataset
+  key                            fingerprinting tokenizer + dataset for the cache key
+  tokenize                       chat template + tokenization (cache miss only)
+  write                          token file + offsets index (cache miss only)
+  barrier                        waiting for rank 0 (torchrun only)
+  open                           mapping the cache files
+
+prepare_splits() splits the cached examples once, by index, and trims the eval
+split to the fixed eval subset; both backends train and evaluate on exactly
+these examples, so their runs are directly comparable. to_hf_dataset() hands
+a split to SFTTrainer as pre-tokenized input_ids, which it uses as they are.
+
+Usage:
+    python preprocess.py
+    python preprocess.py --config configs/leonardo.toml --num_proc 32
+"""
+
+import argparse
+import dataclasses
+import functools
+import hashlib
+import json
+import os
+import shutil
+import time
+
+import torch
+import torch.distributed as dist
+from datasets import Dataset, DatasetDict, load_from_disk
+from transformers import AutoModelForCausalLM, AutoTokenizer
+
+from config import DEFAULT_CONFIG, DataConfig, load_config
+from token_cache import TokenCacheDataset, format_timings, load_or_build_token_cache, timed
+
+## Config -----------------------------
+NUM_PROC        = min(16, len(os.sched_getaffinity(0)))   # cores of this job, not of the node
+MAP_BATCH_SIZE  = 1_000
+MODEL_CACHE_FORMAT = 1
+
+
+## Render + tokenize -----------------------------
+def load_tokenizer(model_id: str):
+    tokenizer = AutoTokenizer.from_pretrained(model_id)
+    tokenizer.pad_token = tokenizer.eos_token
+    return tokenizer
+
+
+def render_and_tokenize(raw, tokenizer, system_prompt: str, max_seq_len: int, num_proc: int = NUM_PROC):
+    """raw (instruction, response) rows -> dataset with only input_ids, in one batched map over num_proc processes."""
+    def process(batch):
+        texts = [
+            tokenizer.apply_chat_template(
+                [
+                    {"role": "system",    "content": system_prompt},
+                    {"role": "user",      "content": instruction},
+                    {"role": "assistant", "content": response},
+                ],
+                tokenize=False, add_generation_prompt=False,
+            )
+            for instruction, response in zip(batch["instruction"], batch["response"])
+        ]
+        # collator pads to longest in batch; the attention mask is rebuilt there too
+        return {"input_ids": tokenizer(texts, truncation=True, max_length=max_seq_len, padding=False)["input_ids"]}
+
+    return raw.map(
+        process,
+        batched=True,
+        batch_size=MAP_BATCH_SIZE,
+        num_proc=num_proc if num_proc > 1 and len(raw) > MAP_BATCH_SIZE else None,
+        remove_columns=raw.column_names,
+        desc="Chat template + tokenize",
+    )
+
+
+def prepare_token_cache(data: DataConfig, verbose: bool = True) -> tuple[object, TokenCacheDataset]:
+    """Tokenizer and the memory-mapped token cache, built on a miss (rank 0 only under torchrun)."""
+    num_proc = data.num_proc or NUM_PROC
+    timings = {}
+    with timed(timings, "model cache"):
+        model_path = cached_model_path(data.model_id, data.model_cache_dir)
+    with timed(timings, "load tokenizer"):
+        tokenizer = load_tokenizer(model_path)
+    with timed(timings, "load dataset"):
+        raw = load_from_disk(data.dataset_path)
+    if isinstance(raw, DatasetDict):
+        # The cache is one flat split; train/eval are split from it afterwards (prepare_splits)
+        raise ValueError(f"{data.dataset_path} holds a DatasetDict (splits {sorted(raw)}); "
+                         f"[data] dataset_path must point at a single Dataset, e.g. one of its split directories")
+    tokenized = load_or_build_token_cache(
+        data.token_cache_dir, tokenizer, data.system_prompt, data.max_seq_len, raw,
+        lambda raw: render_and_tokenize(raw, tokenizer, data.system_prompt, data.max_seq_len, num_proc),
+        timings=timings,
+    )
+    if verbose:
+        print(f"Preprocessing | {format_timings(timings)} | {len(tokenized)} examples, "
+              f"{tokenized.meta['tokens']:,} tokens", flush=True)
+    return tokenizer, tokenized
+
+
+## Split -----------------------------
+def prepare_splits(data: DataConfig, verbose: bool = True) -> tuple[object, TokenCacheDataset, TokenCacheDataset]:
+    """Tokenizer, train split and (fixed subset of the) eval split, identical for both backends."""
+    tokenizer, tokenized = prepare_token_cache(data, verbose)
+    split     = tokenized.train_test_split(test_size=data.test_size, seed=data.split_seed)
+    train_set = split["train"]
+    eval_set  = split["test"] if not data.eval_samples else split["test"].head(data.eval_samples)
+    if verbose:
+        print(f"Data | cache {os.path.basename(tokenized.path)} | seed {data.split_seed} "
+              f"| train {len(train_set)} examples, {int(train_set.lengths.sum()):,} tokens "
+              f"| eval {len(eval_set)} examples, {int(eval_set.lengths.sum()):,} tokens", flush=True)
+    return tokenizer, train_set, eval_set
+
+
+def to_hf_dataset(split: TokenCacheDataset) -> Dataset:
+    """A split as an in-memory datasets.Dataset with only input_ids (SFTTrainer skips its own tokenization)."""
+    return Dataset.from_dict({"input_ids": [split[i]["input_ids"].tolist() for i in range(len(split))]})
+
+
+## Model -----------------------------
+def model_fingerprint(model_id: str) -> dict:
+    """What a snapshot of a local model directory depends on: its path and the size and mtime of every file."""
+    stats = {name: os.stat(os.path.join(model_id, name)) for name in sorted(os.listdir(model_id))}
+    files = {name: [st.st_size, st.st_mtime_ns] for name, st in stats.items() if not os.path.isdir(os.path.join(model_id, name))}
+    return {"format": MODEL_CACHE_FORMAT, "model_id": os.path.abspath(model_id), "dtype": "bfloat16", "files": files}
+
+
+@functools.cache
+def cached_model_path(model_id: str, model_cache_dir: str = "") -> str:
+    """
+    Where the model and tokenizer load from: model_id itself, or with a cache dir, a bf16 safetensors
+    snapshot of it (model + tokenizer) that rank 0 writes on a miss while the other ranks wait on a
+    barrier. Memoized, so the model load after the tokenizer's reuses the answer without a second barrier.
+    """
+    if not model_cache_dir or not os.path.isdir(model_id):
+        return model_id   # no cache, or a hub id that from_pretrained downloads and caches itself
+    meta = model_fingerprint(model_id)
+    path = os.path.join(model_cache_dir, hashlib.sha256(json.dumps(meta, sort_keys=True).encode()).hexdigest()[:16])
+    distributed = dist.is_available() and dist.is_initialized()
+
+    if (dist.get_rank() if distributed else 0) == 0:
+        if os.path.isdir(path):
+            print(f"Model cache hit: {path}", flush=True)
+        else:
+            print(f"Model cache miss, writing a bf16 snapshot of {model_id}: {path}", flush=True)
+            t0 = time.time()
+            tmp = f"{path}.tmp-{os.getpid()}"
+            AutoModelForCausalLM.from_pretrained(model_id, torch_dtype=torch.bfloat16).save_pretrained(tmp)
+            AutoTokenizer.from_pretrained(model_id).save_pretrained(tmp)
+            with open(os.path.join(tmp, "model_cache.json"), "w") as fh:
+                json.dump(meta, fh, indent=2)
+            try:
+                os.rename(tmp, path)
+            except OSError:
+                # Another process committed the same key first; its files are identical
+                shutil.rmtree(tmp, ignore_errors=True)
+            print(f"Model cache written in {time.time() - t0:.1f}s", flush=True)
+    if distributed:
+        dist.barrier()
+    return path
+
+
+def load_model(data: DataConfig, **kwargs):
+    """The model in bf16, from the model cache when [data] model_cache_dir is set."""
+    model_path = cached_model_path(data.model_id, data.model_cache_dir)
+    return AutoModelForCausalLM.from_pretrained(model_path, torch_dtype=torch.bfloat16, **kwargs)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Build the token and model caches for both training backends")
+    parser.add_argument("--config",          default=DEFAULT_CONFIG, help="Run config; its [data] section is used")
+    parser.add_argument("--token_cache_dir", default=None, help="Where the pre-tokenized dataset is cached (default: from the config)")
+    parser.add_argument("--num_proc",        default=None, type=int, help=f"Tokenization processes (default: from the config, else {NUM_PROC})")
+    args = parser.parse_args()
+
+    data = load_config(args.config).data
+    overrides = {k: v for k, v in (("token_cache_dir", args.token_cache_dir), ("num_proc", args.num_proc)) if v is not None}
+    prepare_splits(dataclasses.replace(data, **overrides))
@@ -0,0 +1,149 @@
+"""
+Length-aware batch sampler for DDP.
+
+A plain DistributedSampler deals shuffled examples to ranks one by one, so every
+step mixes short and long dialogs: batches carry a lot of padding and whichever
+rank drew the longest batch holds everyone up at the gradient all-reduce.
+
+LengthBucketBatchSampler instead cuts each epoch's shuffle into large buckets,
+sorts every bucket by length, and forms *global* batches (batch_size x
+world_size) of neighbouring lengths. Each global batch is dealt to the ranks in
+snake order, so all ranks see near-identical lengths at every step. The order
+of global batches is shuffled again, so the long ones are not all together.
+Everything is a pure function of (seed, epoch): every rank computes the same
+plan without communicating.
+
+Both samplers take set_start() to begin an epoch part-way through, so a run
+resumed from a mid-epoch snapshot skips consumed batches without loading them.
+
+ShardedEvalSampler deals the eval set so every example is seen exactly once
+across ranks: DistributedSampler pads by repeating examples, which counts them
+twice in the eval loss.
+"""
+
+import itertools
+import math
+
+import numpy as np
+from torch.utils.data import Sampler
+from torch.utils.data.distributed import DistributedSampler
+import torch.distributed as dist
+
+
+class ResumableDistributedSampler(DistributedSampler):
+    """DistributedSampler that can start an epoch part-way through, skipping indices without loading them."""
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.start_index = 0
+
+    def set_start(self, start_index: int) -> None:
+        """Skip the first start_index samples of this rank's share of the current epoch."""
+        self.start_index = start_index
+
+    def __iter__(self):
+        return itertools.islice(super().__iter__(), self.start_index, None)
+
+    def __len__(self):
+        return self.num_samples - self.start_index
+
+
+class LengthBucketBatchSampler(Sampler):
+    def __init__(self, lengths, batch_size: int, num_replicas: int | None = None, rank: int | None = None,
+                 shuffle: bool = True, seed: int = 0, bucket_size_multiplier: int = 50, drop_last: bool = False):
+        if num_replicas is None:
+            num_replicas = dist.get_world_size() if dist.is_initialized() else 1
+        if rank is None:
+            rank = dist.get_rank() if dist.is_initialized() else 0
+        self.lengths = np.asarray(lengths)
+        self.batch_size = batch_size
+        self.num_replicas = num_replicas
+        self.rank = rank
+        self.shuffle = shuffle
+        self.seed = seed
+        self.bucket_size = batch_size * num_replicas * bucket_size_multiplier
+        self.drop_last = drop_last
+        self.epoch = 0
+        self.start_batch = 0
+
+    def set_epoch(self, epoch: int) -> None:
+        self.epoch = epoch
+
+    def set_start(self, start_batch: int) -> None:
+        """Skip the first start_batch batches of the current epoch (mid-epoch resume)."""
+        self.start_batch = start_batch
+
+    def num_batches(self) -> int:
+        global_batch = self.batch_size * self.num_replicas
+        n = len(self.lengths)
+        return n // global_batch if self.drop_last else math.ceil(n / global_batch)
+
+    def __len__(self):
+        return self.num_batches() - self.start_batch
+
+    def global_batches(self) -> np.ndarray:
+        """[steps, num_replicas, batch_size] example indices for the current epoch."""
+        rng = np.random.default_rng((self.seed, self.epoch))
+        n = len(self.lengths)
+        order = rng.permutation(n) if self.shuffle else np.arange(n)
+
+        # Pad by wrapping around (like DistributedSampler) so every rank gets the same number of steps
+        global_batch = self.batch_size * self.num_replicas
+        total = self.num_batches() * global_batch
+        order = order[:total] if self.drop_last else np.resize(order, total)
+
+        batches = []
+        for start in range(0, total, self.bucket_size):
+            bucket = order[start:start + self.bucket_size]
+            bucket = bucket[np.argsort(-self.lengths[bucket], kind="stable")]
+            batches.extend(bucket.reshape(-1, global_batch))
+        batches = np.stack(batches)
+        if self.shuffle:
+            batches = batches[rng.permutation(len(batches))]
+
+        # Snake order: rank r takes positions r, 2W-1-r, 2W+r, ... of each length-sorted global batch
+        snake = np.concatenate([np.arange(self.num_replicas), np.arange(self.num_replicas)[::-1]])
+        owner = np.resize(snake, global_batch)
+        per_rank = [batches[:, owner == r] for r in range(self.num_replicas)]
+        return np.stack(per_rank, axis=1)
+
+    def __iter__(self):
+        for step in self.global_batches()[self.start_batch:, self.rank]:
+            yield step.tolist()
+
+    def balance_report(self) -> str:
+        """Padding fraction and straggler cost (slowest rank / mean rank, in padded tokens) vs a random split."""
+        bucketed = self.global_batches()
+        rng = np.random.default_rng((self.seed, self.epoch))
+        random = np.resize(rng.permutation(len(self.lengths)), bucketed.size).reshape(bucketed.shape)
+        parts = []
+        for name, plan in (("random", random), ("bucketed", bucketed)):
+            lengths = self.lengths[plan]                                # [steps, ranks, batch]
+            padded = lengths.max(axis=2) * self.batch_size              # tokens each rank computes per step
+            straggler = (padded.max(axis=1) / padded.mean(axis=1)).mean()
+            parts.append(f"{name}: padding {1 - lengths.sum() / padded.sum():.1%}, straggler {straggler:.2f}x")
+        return "length bucketing | " + " | ".join(parts)
+
+
+class ShardedEvalSampler(Sampler):
+    """
+    Rank r takes examples r, r + W, r + 2W, ... with no padding, so shares differ by at most one
+    example. Order within a share does not matter for eval: it is sorted by length when the
+    dataset has `lengths`, so batches carry little padding.
+    """
+    def __init__(self, dataset, num_replicas: int | None = None, rank: int | None = None):
+        if num_replicas is None:
+            num_replicas = dist.get_world_size() if dist.is_initialized() else 1
+        if rank is None:
+            rank = dist.get_rank() if dist.is_initialized() else 0
+        if len(dataset) < num_replicas:
+            raise ValueError(f"eval set of {len(dataset)} examples is smaller than the world size {num_replicas}")
+        self.indices = np.arange(rank, len(dataset), num_replicas)
+        lengths = getattr(dataset, "lengths", None)
+        if lengths is not None:
+            self.indices = self.indices[np.argsort(-np.asarray(lengths)[self.indices], kind="stable")]
+
+    def __iter__(self):
+        return iter(self.indices.tolist())
+
+    def __len__(self):
+        return len(self.indices)
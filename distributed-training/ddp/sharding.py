@@ -0,0 +1,70 @@
+"""
+Fully sharded data parallel (FSDP2) mode for the Trainer.
+
+DDP keeps a full replica of the weights, gradients and AdamW moments on every
+rank. fully_shard() splits each of them along dim 0 across the ranks instead:
+every decoder layer becomes its own FSDP unit whose weights are all-gathered
+just before its forward/backward and freed right after, and gradients are
+reduce-scattered so each rank only keeps (and updates) its 1/N slice. Per-rank
+state memory drops from P + G + O to roughly (P + G + O) / N, plus one
+unsharded layer at a time.
+
+The model must be sharded *before* the optimizer is built: fully_shard()
+replaces the parameters with sharded DTensors. Checkpoints store each rank's
+local slices (see checkpointing.py) and can be resumed at any world size, and
+from or into DDP runs.
+"""
+
+import torch
+import torch.distributed as dist
+from torch.distributed.device_mesh import init_device_mesh
+from torch.distributed.fsdp import fully_shard
+from torch.distributed.tensor import DTensor
+
+
+## Sharding -----------------------------
+def transformer_blocks(model: torch.nn.Module) -> list[torch.nn.Module]:
+    """The repeated blocks of an HF model, in order (classes named in _no_split_modules, e.g. LlamaDecoderLayer)."""
+    names = set(getattr(model, "_no_split_modules", None) or ())
+    # via the MRO: fully_shard() swaps in a subclass (FSDPLlamaDecoderLayer)
+    return [module for module in model.modules() if any(c.__name__ in names for c in type(module).__mro__)]
+
+
+def shard_model(model: torch.nn.Module) -> torch.nn.Module:
+    """Shard every transformer block, then the root (embeddings, final norm, LM head), in place."""
+    mesh = init_device_mesh("cuda" if torch.cuda.is_available() else "cpu", (dist.get_world_size(),))
+    for block in transformer_blocks(model):
+        fully_shard(block, mesh=mesh)
+    fully_shard(model, mesh=mesh)   # also moves the local shards to the device
+    return model
+
+
+## Memory report -----------------------------
+def local_tensor(t: torch.Tensor) -> torch.Tensor:
+    return t.to_local() if isinstance(t, DTensor) else t
+
+
+def state_memory_gb(model: torch.nn.Module, optimizer: torch.optim.Optimizer) -> dict:
+    """
+    Bytes held by parameters, gradients and optimizer state on this rank, and what the
+    same state costs as a full DDP replica. Call after the first optimizer step (AdamW
+    allocates its moments lazily).
+    """
+    def nbytes(tensors, local: bool) -> float:
+        return sum((local_tensor(t) if local else t).numel() * t.element_size() for t in tensors) / 1e9
+
+    params = list(model.parameters())
+    grads  = [p.grad for p in params if p.grad is not None]
+    states = [v for s in optimizer.state.values() for v in s.values() if torch.is_tensor(v) and v.dim() > 0]
+    report = {}
+    for name, tensors in (("params", params), ("grads", grads), ("optimizer", states)):
+        report[name] = nbytes(tensors, local=True)
+        report[f"{name}_replicated"] = nbytes(tensors, local=False)
+    return report
+
+
+def format_memory_report(report: dict) -> str:
+    local = report["params"] + report["grads"] + report["optimizer"]
+    full  = report["params_replicated"] + report["grads_replicated"] + report["optimizer_replicated"]
+    return (f"state memory per rank | params {report['params']:.2f} GB, grads {report['grads']:.2f} GB, "
+            f"optimizer {report['optimizer']:.2f} GB | total {local:.2f} GB vs {full:.2f} GB as a DDP replica")
@@ -0,0 +1,183 @@
+"""
+Pre-tokenized, memory-mapped dataset cache for the DDP trainer.
+
+The chat-templated, tokenized dataset is written once as a flat token file
+(tokens.bin) plus an offsets index (offsets.npy), under a directory named by
+a hash of everything that determines the token ids: tokenizer, chat template,
+system prompt, max_seq_len and the source dataset fingerprint. Every rank then
+maps the same files read-only, so a warm start costs a few syscalls instead of
+re-templating and re-tokenizing the whole dataset on every rank.
+
+Layout:
+    <cache_dir>/<key>/tokens.bin    uint16/uint32 token ids, all examples back to back
+    <cache_dir>/<key>/offsets.npy   int64 [n_examples + 1], example i = tokens[offsets[i]:offsets[i+1]]
+    <cache_dir>/<key>/meta.json     what the key was computed from
+"""
+
+import hashlib
+import json
+import math
+import os
+import shutil
+import time
+from contextlib import contextmanager
+
+import numpy as np
+import torch.distributed as dist
+from torch.utils.data import Dataset
+
+CACHE_FORMAT = 1
+
+
+## Cache key -----------------------------
+def tokenizer_fingerprint(tokenizer) -> str:
+    """Hash of the vocabulary, merges/normalizers and special tokens, independent of where the tokenizer was loaded from."""
+    h = hashlib.sha256(type(tokenizer).__name__.encode())
+    backend = getattr(tokenizer, "backend_tokenizer", None)
+    if backend is not None:
+        h.update(backend.to_str().encode())
+    else:
+        h.update(json.dumps(sorted(tokenizer.get_vocab().items())).encode())
+    h.update(json.dumps(tokenizer.special_tokens_map, sort_keys=True, default=str).encode())
+    return h.hexdigest()
+
+
+def dataset_fingerprint(dataset) -> str:
+    """datasets' own content hash of a single Dataset (the cache holds one flat split)."""
+    return dataset._fingerprint
+
+
+def cache_key(tokenizer, system_prompt: str, max_seq_len: int, dataset) -> tuple[str, dict]:
+    meta = {
+        "format":        CACHE_FORMAT,
+        "tokenizer":     tokenizer_fingerprint(tokenizer),
+        "chat_template": tokenizer.chat_template,
+        "system_prompt": system_prompt,
+        "max_seq_len":   max_seq_len,
+        "dataset":       dataset_fingerprint(dataset),
+    }
+    key = hashlib.sha256(json.dumps(meta, sort_keys=True).encode()).hexdigest()[:16]
+    return key, meta
+
+
+## Memory-mapped dataset -----------------------------
+class TokenCacheDataset(Dataset):
+    """
+    Read-only view over a token cache. Items are {"input_ids": ndarray} slices of
+    the shared mapping (no copy until the collator pads them), so every rank and
+    DataLoader worker shares the same page cache.
+    """
+    def __init__(self, path: str, indices: np.ndarray | None = None):
+        self.path = path
+        self.offsets = np.load(os.path.join(path, "offsets.npy"), mmap_mode="r")
+        with open(os.path.join(path, "meta.json")) as fh:
+            self.meta = json.load(fh)
+        self.tokens = np.memmap(os.path.join(path, "tokens.bin"), dtype=self.meta["dtype"], mode="r")
+        self.indices = indices
+
+    def __getstate__(self):
+        # Re-map in spawned DataLoader workers instead of pickling the token array
+        return {"path": self.path, "indices": self.indices}
+
+    def __setstate__(self, state):
+        self.__init__(state["path"], state["indices"])
+
+    def __len__(self):
+        return len(self.offsets) - 1 if self.indices is None else len(self.indices)
+
+    def __getitem__(self, idx):
+        i = idx if self.indices is None else int(self.indices[idx])
+        return {"input_ids": self.tokens[self.offsets[i]:self.offsets[i + 1]]}
+
+    @property
+    def lengths(self) -> np.ndarray:
+        lengths = np.diff(self.offsets)
+        return lengths if self.indices is None else lengths[self.indices]
+
+    def head(self, n: int) -> "TokenCacheDataset":
+        """The first n examples; on a train_test_split() half, a fixed random subset."""
+        base = np.arange(len(self)) if self.indices is None else self.indices
+        return TokenCacheDataset(self.path, base[:n])
+
+    def train_test_split(self, test_size: float, seed: int) -> dict:
+        """Same permutation as datasets.Dataset.train_test_split(test_size, seed=seed), so splits match the uncached path."""
+        n = len(self)
+        n_test = math.ceil(test_size * n)
+        permutation = np.random.default_rng(seed).permutation(n)
+        base = np.arange(n) if self.indices is None else self.indices
+        return {
+            "train": TokenCacheDataset(self.path, base[permutation[n_test:]]),
+            "test":  TokenCacheDataset(self.path, base[permutation[:n_test]]),
+        }
+
+
+## Build -----------------------------
+@contextmanager
+def timed(timings: dict | None, stage: str):
+    """Add the wall time of the block to timings[stage] (no-op without a dict)."""
+    t0 = time.perf_counter()
+    try:
+        yield
+    finally:
+        if timings is not None:
+            timings[stage] = timings.get(stage, 0.0) + time.perf_counter() - t0
+
+
+def format_timings(timings: dict) -> str:
+    return " | ".join(f"{stage} {seconds:.1f}s" for stage, seconds in timings.items())
+
+
+def write_token_cache(path: str, tokenized, meta: dict, vocab_size: int, batch_size: int = 1_000) -> None:
+    """Stream tokenized["input_ids"] into a temporary directory, then rename it into place."""
+    dtype = np.uint16 if vocab_size <= np.iinfo(np.uint16).max + 1 else np.uint32
+    tmp = f"{path}.tmp-{os.getpid()}"
+    os.makedirs(tmp, exist_ok=True)
+
+    offsets = [0]
+    with open(os.path.join(tmp, "tokens.bin"), "wb") as fh:
+        for batch in tokenized.iter(batch_size=batch_size):
+            for ids in batch["input_ids"]:
+                np.asarray(ids, dtype=dtype).tofile(fh)
+                offsets.append(offsets[-1] + len(ids))
+    np.save(os.path.join(tmp, "offsets.npy"), np.asarray(offsets, dtype=np.int64))
+    with open(os.path.join(tmp, "meta.json"), "w") as fh:
+        json.dump({**meta, "dtype": np.dtype(dtype).name, "examples": len(offsets) - 1, "tokens": offsets[-1]}, fh, indent=2)
+
+    try:
+        os.rename(tmp, path)
+    except OSError:
+        # Another process committed the same key first; its files are identical
+        shutil.rmtree(tmp, ignore_errors=True)
+
+
+def load_or_build_token_cache(cache_dir: str, tokenizer, system_prompt: str, max_seq_len: int,
+                              raw, tokenize_fn, timings: dict | None = None) -> TokenCacheDataset:
+    """
+    Rank 0 builds the cache if it is missing (tokenize_fn(raw) -> dataset with
+    input_ids), every other rank waits on a barrier and maps the result.
+    Works without an initialized process group as a single-process build.
+    Stage times (key, tokenize, write, barrier, open) are added to timings.
+    """
+    with timed(timings, "key"):
+        key, meta = cache_key(tokenizer, system_prompt, max_seq_len, raw)
+    path = os.path.join(cache_dir, key)
+    distributed = dist.is_available() and dist.is_initialized()
+    rank = dist.get_rank() if distributed else 0
+
+    if rank == 0:
+        if os.path.isdir(path):
+            print(f"Token cache hit: {path}", flush=True)
+        else:
+            print(f"Token cache miss, building: {path}", flush=True)
+            t0 = time.time()
+            os.makedirs(cache_dir, exist_ok=True)
+            with timed(timings, "tokenize"):
+                tokenized = tokenize_fn(raw)
+            with timed(timings, "write"):
+                write_token_cache(path, tokenized, meta, len(tokenizer))
+            print(f"Token cache built in {time.time() - t0:.1f}s", flush=True)
+    if distributed:
+        with timed(timings, "barrier"):
+            dist.barrier()
+    with timed(timings, "open"):
+        return TokenCacheDataset(path)